@@ -0,0 +1,95 @@
+# Software License Agreement (MIT License)
+#
+# Copyright (C) 2019 Chuanyu Pan (pancy17@mails.tsinghua.edu.cn)
+# All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and 
+#associated documentation files (the "Software"), to deal in the Software without restriction, 
+#including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+#and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, 
+#subject to the following conditions:
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in the
+#   documentation and/or other materials provided with the distribution.
+# * Neither the name of the Tsinghua University nor the
+#   names of its contributors may be used to endorse or promote products
+#   derived from this software without specific prior written permission.
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES 
+#OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE 
+#LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR 
+#IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+'''
+command line entry point: python -m NetPainter [FILE ...]
+
+Render every model spec (see spec.py) of the files, or of stdin, one after another in this process.
+With --layout, nothing is drawn (and cairo is not even loaded): the layout of every spec is printed instead.
+'''
+
+import sys
+import json
+import argparse
+
+from NetPainter.spec import iter_specs, build_model, draw_options
+from NetPainter.batch import render_iter
+
+
+def _read_specs(filenames):
+    for filename in filenames:
+        if filename == '-':
+            yield from iter_specs(sys.stdin)
+        else:
+            with open(filename) as fp:
+                yield from iter_specs(fp)
+
+
+def _print_layouts(specs):
+    '''print the layout (see Model.layout_data) or the error of every spec as a JSON line, returns the number of errors'''
+    failed = 0
+    for index, spec in enumerate(specs):
+        try:
+            model = build_model(spec)
+            draw_options(spec)
+            line = {'index': index, 'layout': model.layout_data(), 'error': None}
+        except Exception as e:
+            failed += 1
+            line = {'index': index, 'layout': None, 'error': '%s: %s' % (type(e).__name__, e)}
+        print(json.dumps(line), flush=True)
+    return failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m NetPainter',
+                                     description='Draw network diagrams from JSON / JSON lines model specs.')
+    parser.add_argument('files', nargs='*', default=['-'], help='spec files, - or nothing for stdin')
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='number of rendering processes (default 1: render in this process)')
+    parser.add_argument('-o', '--output-pattern', default='network_%d.png',
+                        help='output of the specs without "output", %%d is the spec index (default network_%%d.png)')
+    parser.add_argument('-c', '--cache-dir',
+                        help='keep the pictures in this directory and only copy them again for unchanged specs')
+    parser.add_argument('--layout', action='store_true',
+                        help="don't draw, print the layout of every spec as a JSON line (eg. to check specs)")
+    parser.add_argument('-q', '--quiet', action='store_true', help="don't print a JSON line per spec")
+    args = parser.parse_args(argv)
+    if args.layout:
+        return 1 if _print_layouts(_read_specs(args.files)) else 0
+
+    failed = 0
+    for result in render_iter(_read_specs(args.files), workers=args.workers, output_pattern=args.output_pattern,
+                              cache_dir=args.cache_dir):
+        failed += result.error is not None
+        if not args.quiet:
+            print(json.dumps(result._asdict()), flush=True)
+        elif result.error is not None:
+            print('spec %d: %s' % (result.index, result.error), file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
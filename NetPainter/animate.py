@@ -0,0 +1,225 @@
+# Software License Agreement (MIT License)
+#
+# Copyright (C) 2019 Chuanyu Pan (pancy17@mails.tsinghua.edu.cn)
+# All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and 
+#associated documentation files (the "Software"), to deal in the Software without restriction, 
+#including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+#and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, 
+#subject to the following conditions:
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in the
+#   documentation and/or other materials provided with the distribution.
+# * Neither the name of the Tsinghua University nor the
+#   names of its contributors may be used to endorse or promote products
+#   derived from this software without specific prior written permission.
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES 
+#OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE 
+#LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR 
+#IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+'''animate (frame sequences of a Model: layers appearing one by one, or highlighted one by one)'''
+
+import os
+import math
+import zlib
+import struct
+from NetPainter.lazy import cairo
+import NetPainter.utils as utils
+import NetPainter.text as text
+import NetPainter.tiles as tiles
+
+
+def _union(bbox, other):
+    if bbox is None:
+        return other
+    return min(bbox[0], other[0]), min(bbox[1], other[1]), max(bbox[2], other[2]), max(bbox[3], other[3])
+
+
+def _damage(model, indices):
+    '''(x0, y0, x1, y1) covered by the modules of indices with their kernels and notations'''
+    bbox = None
+    for index in indices:
+        module = model.modules[index]
+        bbox = _union(bbox, model._module_bbox(module))
+        if model._kernel_bbox(module) is not None:
+            bbox = _union(bbox, model._kernel_bbox(module))
+        if module.notation==True:
+            bbox = _union(bbox, model._text_bbox(module))
+    return bbox
+
+
+class _Canvas:
+    def __init__(self, model, add_note, add_para):
+        '''
+        The picture of model, kept between frames: a frame only paints again the rectangles
+        where something changed, with what crosses them, in the order of Model._paint.
+        '''
+        model._update_lenth()
+        self.model = model
+        self.add_note = add_note
+        self.add_para = add_para
+        self.slices = model._get_slices()
+        self.surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, model.img_w, model.img_h)
+
+
+    def repaint(self, bbox, count, colors):
+        '''
+        Paint bbox again with the first count modules, colors {module index: (r, g, b)} overrides their colors.
+        Returns the rectangle of pixels (x, y, width, height) painted again.
+        '''
+        model = self.model
+        #antialiased edges and lines go a bit further than the bounding boxes
+        x0 = max(0, int(math.floor(bbox[0])) - 2)
+        y0 = max(0, int(math.floor(bbox[1])) - 2)
+        x1 = min(model.img_w, int(math.ceil(bbox[2])) + 2)
+        y1 = min(model.img_h, int(math.ceil(bbox[3])) + 2)
+        if x1 <= x0 or y1 <= y0:
+            return 0, 0, 0, 0
+        saved = model.cr, model.view
+        model.cr = cr = cairo.Context(self.surface)
+        model.view = (x0, y0, x1, y1)
+        try:
+            cr.rectangle(x0, y0, x1 - x0, y1 - y0)
+            cr.clip()
+            cr.set_operator(cairo.OPERATOR_CLEAR)
+            cr.paint()
+            cr.set_operator(cairo.OPERATOR_OVER)
+            notes = model._notes_bbox()
+            if self.add_note and notes is not None and model._visible(notes):
+                model._add_notes()
+            model._Draw_Connectors()
+            for index in range(count):
+                module = model.modules[index]
+                if model._visible(model._module_bbox(module)):
+                    model._Draw_Module(index, module, self.slices, colors.get(index))
+            model._Draw_Kernels(range(count))
+            if self.add_para:
+                cr.set_source_rgb(0, 0, 0)
+                text.cache.show_texts(cr, model.font, model.font_size,
+                                      [model._text_notation(module) for module in model.modules[:count]
+                                       if module.notation==True and model._visible(model._text_bbox(module))])
+        finally:
+            model.cr, model.view = saved
+        self.surface.flush()
+        return x0, y0, x1 - x0, y1 - y0
+
+
+def build_up(model, add_note=True, add_para=True):
+    '''
+    Frames of the layers of model appearing one by one, at their place in the whole picture
+    (the notes and the connectors are there from the first frame).
+    Yields (surface, (x, y, width, height)) for every module: the picture so far, and the rectangle
+    changed since the previous frame (the whole picture for the first one).
+    The surface is the same for all frames, it is changed by the next one.
+    '''
+    canvas = _Canvas(model, add_note, add_para)
+    for index in range(len(model.modules)):
+        if index == 0:
+            canvas.repaint((0, 0, model.img_w, model.img_h), 1, {})
+            yield canvas.surface, (0, 0, model.img_w, model.img_h)
+        else:
+            yield canvas.surface, canvas.repaint(_damage(model, [index]), index + 1, {})
+
+
+def highlight(model, indices=None, color=(1.0, 0.2, 0.2), add_note=True, add_para=True):
+    '''
+    Frames of the whole picture of model with one module drawn in color (r, g, b), for every module
+    of indices (all of them by default). Yields (surface, rectangle) like build_up.
+    '''
+    canvas = _Canvas(model, add_note, add_para)
+    count = len(model.modules)
+    previous = None
+    for index in range(count) if indices is None else indices:
+        if previous is None:
+            canvas.repaint((0, 0, model.img_w, model.img_h), count, {index: color})
+            yield canvas.surface, (0, 0, model.img_w, model.img_h)
+        else:
+            #the previous module gets its color back, the union of both is what changed
+            bbox = _union(_damage(model, [previous]), _damage(model, [index]))
+            yield canvas.surface, canvas.repaint(bbox, count, {index: color})
+        previous = index
+
+
+def write_pngs(frames, pattern='frame_%04d.png'):
+    '''write every frame of frames (see build_up/highlight) to pattern % number, returns the number of frames'''
+    number = 0
+    for number, (surface, rectangle) in enumerate(frames, 1):
+        surface.write_to_png(pattern % (number - 1))
+    return number
+
+
+class APNGWriter(tiles.PNGWriter):
+    def __init__(self, fp, width, height, plays=0):
+        '''
+        Write an animated PNG to the binary file object fp, frame by frame (see add_frame).
+        Every frame after the first one only holds the rectangle which changed.
+        The compressed frames are kept until close, where the number of frames is known.
+        plays: number of times the animation is played, 0 is forever
+        '''
+        super().__init__(fp, width, height)
+        self.plays = plays
+        self.frames = 0
+        self.sequence = 0
+        self._chunks = []
+
+
+    def add_frame(self, rgba, x=0, y=0, delay=0.5):
+        '''
+        rgba: uint8 numpy array (height, width, 4) of RGBA pixels, shown at (x, y) over the previous frame
+        for delay seconds. The first frame must be the whole picture.
+        '''
+        height, width = rgba.shape[:2]
+        filtered = bytearray()
+        for row in rgba:
+            filtered += b'\x00' + row.tobytes()
+        data = zlib.compress(bytes(filtered), 6)
+        #delay in 1/1000 s, dispose: none, blend: source (the rectangle replaces what was there)
+        self._chunks.append((b'fcTL', struct.pack('>IIIIIHHBB', self.sequence, width, height, x, y,
+                                                  int(round(delay * 1000)), 1000, 0, 0)))
+        self.sequence += 1
+        if self.frames == 0:
+            self._chunks.append((b'IDAT', data))
+        else:
+            self._chunks.append((b'fdAT', struct.pack('>I', self.sequence) + data))
+            self.sequence += 1
+        self.frames += 1
+
+
+    def close(self):
+        self._chunk(b'acTL', struct.pack('>II', self.frames, self.plays))
+        for kind, data in self._chunks:
+            self._chunk(kind, data)
+        self._chunk(b'IEND', b'')
+
+
+def write_apng(frames, output_filename, delay=0.5, plays=0):
+    '''
+    Write frames (see build_up/highlight) as an animated PNG (a filename or a binary file object),
+    converting and compressing only the changed rectangle of every frame. numpy is needed.
+    Returns the number of frames.
+    '''
+    if not utils.np.available():
+        raise ImportError('numpy is required to write an animated PNG')
+    fp = open(output_filename, 'wb') if isinstance(output_filename, (str, bytes, os.PathLike)) else output_filename
+    try:
+        writer = None
+        for surface, (x, y, width, height) in frames:
+            if writer is None:
+                writer = APNGWriter(fp, surface.get_width(), surface.get_height(), plays)
+            if width == 0 or height == 0:
+                #nothing changed (eg. out of the picture), show the previous frame longer
+                x, y, width, height = 0, 0, 1, 1
+            pixels = utils.surface_to_array(surface)[y:y + height, x:x + width]
+            writer.add_frame(tiles.to_rgba(pixels), x, y, delay)
+        if writer is not None:
+            writer.close()
+        return 0 if writer is None else writer.frames
+    finally:
+        if fp is not output_filename:
+            fp.close()
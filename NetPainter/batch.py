@@ -0,0 +1,100 @@
+# Software License Agreement (MIT License)
+#
+# Copyright (C) 2019 Chuanyu Pan (pancy17@mails.tsinghua.edu.cn)
+# All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and 
+#associated documentation files (the "Software"), to deal in the Software without restriction, 
+#including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+#and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, 
+#subject to the following conditions:
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in the
+#   documentation and/or other materials provided with the distribution.
+# * Neither the name of the Tsinghua University nor the
+#   names of its contributors may be used to endorse or promote products
+#   derived from this software without specific prior written permission.
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES 
+#OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE 
+#LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR 
+#IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+'''batch (render many model specs in parallel processes)'''
+
+import os
+import time
+import itertools
+import collections
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from NetPainter.spec import build_model, draw_options
+import NetPainter.cache as cache
+
+'''
+index : position of the spec in the input
+output : where the picture is written
+seconds : wall time of building and drawing the model
+error : None, or a message if the spec failed
+'''
+RenderResult = collections.namedtuple('RenderResult', ['index', 'output', 'seconds', 'error'])
+
+
+def render_spec(index, spec, output_pattern='network_%d.png', cache_dir=None):
+    '''
+    Build and draw one spec (see spec.py), the picture goes to spec['output'] or output_pattern % index
+    cache_dir: If it's set, unchanged pictures are copied from this directory (see cache.DiskCache)
+    '''
+    output = spec.get('output', output_pattern % index) if isinstance(spec, dict) else None
+    begin = time.perf_counter()
+    try:
+        model = build_model(spec)
+        model.set_surface_pool(cache.surfaces) # pixels reused by the next specs of this process
+        if cache_dir is not None:
+            model.set_disk_cache(cache.DiskCache(cache_dir))
+        model.Draw(output, **draw_options(spec))
+    except Exception as e:
+        return RenderResult(index, output, time.perf_counter() - begin, '%s: %s' % (type(e).__name__, e))
+    return RenderResult(index, output, time.perf_counter() - begin, None)
+
+
+def render_iter(specs, workers=None, output_pattern='network_%d.png', cache_dir=None):
+    '''
+    Render specs (any iterable, it is consumed lazily) and yield a RenderResult for each one
+    as soon as it is finished, so not necessarily in order.
+
+    workers: Number of processes; None uses all cpus, 1 renders in this process.
+    Every process draws one model at a time, on surfaces kept for its next specs (cache.surfaces,
+    one pool per process). At most 2*workers specs
+    are waiting in the pool, so a long iterable is never loaded at once.
+    cache_dir: see render_spec
+    '''
+    specs = enumerate(specs)
+    if workers == 1:
+        for index, spec in specs:
+            yield render_spec(index, spec, output_pattern, cache_dir)
+        return
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        backlog = 2 * workers
+        running = set(pool.submit(render_spec, index, spec, output_pattern, cache_dir)
+                      for index, spec in itertools.islice(specs, backlog))
+        while running:
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            for index, spec in itertools.islice(specs, len(done)):
+                running.add(pool.submit(render_spec, index, spec, output_pattern, cache_dir))
+            for future in done:
+                yield future.result()
+
+
+def render_many(specs, workers=None, output_pattern='network_%d.png', cache_dir=None):
+    '''
+    Render a list of specs across a process pool (see render_iter)
+    Returns the RenderResult of every spec, in the order of specs. A failed spec doesn't stop the others,
+    its error is reported in the result.
+    '''
+    return sorted(render_iter(specs, workers, output_pattern, cache_dir), key=lambda result: result.index)
@@ -0,0 +1,330 @@
+# Software License Agreement (MIT License)
+#
+# Copyright (C) 2019 Chuanyu Pan (pancy17@mails.tsinghua.edu.cn)
+# All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and 
+#associated documentation files (the "Software"), to deal in the Software without restriction, 
+#including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+#and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, 
+#subject to the following conditions:
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in the
+#   documentation and/or other materials provided with the distribution.
+# * Neither the name of the Tsinghua University nor the
+#   names of its contributors may be used to endorse or promote products
+#   derived from this software without specific prior written permission.
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES 
+#OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE 
+#LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR 
+#IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+'''cache (caches shared by the drawings)'''
+
+import os
+import math
+import json
+import shutil
+import hashlib
+import threading
+import collections
+from NetPainter.lazy import cairo
+import NetPainter.utils as utils
+
+
+class SpriteCache:
+    def __init__(self, max_bytes=64*1024*1024):
+        '''
+        Slices drawn once into small surfaces (sprites) and then pasted wherever the same slice
+        appears again, eg. the slice_num slices of a module.
+
+        A sprite is kept for every (length, height, width, color, scale, sub-pixel position),
+        the sub-pixel position is rounded to a quarter of pixel.
+        When the sprites take more than max_bytes, the least recently used ones are dropped.
+        It can be shared by drawings running in several threads, sprites are never changed once made.
+        '''
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._sprites = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+
+    def __len__(self):
+        return len(self._sprites)
+
+
+    def clear(self):
+        with self._lock:
+            self._sprites.clear()
+            self.nbytes = 0
+
+
+    def _render(self, length, height, width, r, g, b, scale, phase_x, phase_y):
+        '''sprite of a slice whose center is at (phase_x, phase_y) of a pixel, with its offset to that pixel'''
+        a = length/2.828
+        left = int(math.floor(phase_x - a*scale)) - 1
+        top = int(math.floor(phase_y - (height/2 + a)*scale)) - 1
+        right = int(math.ceil(phase_x + (width + a)*scale)) + 1
+        bottom = int(math.ceil(phase_y + (height/2 + a)*scale)) + 1
+        surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, right - left, bottom - top)
+        cr = cairo.Context(surface)
+        cr.translate(phase_x - left, phase_y - top)
+        cr.scale(scale, scale)
+        utils.draw_layer_slice(cr, 0, 0, length, height, width, r, g, b)
+        surface.flush()
+        return surface, left, top
+
+
+    def get(self, length, height, width, r, g, b, scale=1.0, phase_x=0.0, phase_y=0.0):
+        '''(surface, left, top) of a slice sprite, see _render'''
+        phase_x = round(phase_x * 4) / 4
+        phase_y = round(phase_y * 4) / 4
+        key = (length, height, width, r, g, b, scale, phase_x, phase_y)
+        with self._lock:
+            sprite = self._sprites.get(key)
+            if sprite is not None:
+                self.hits += 1
+                self._sprites.move_to_end(key)
+                return sprite
+            self.misses += 1
+        #drawn without the lock, another thread may draw the same sprite meanwhile, the first one is kept
+        sprite = self._render(length, height, width, r, g, b, scale, phase_x, phase_y)
+        with self._lock:
+            if key in self._sprites:
+                return self._sprites[key]
+            self._sprites[key] = sprite
+            self.nbytes += sprite[0].get_stride() * sprite[0].get_height()
+            while self.nbytes > self.max_bytes and len(self._sprites) > 1:
+                old_key, old = self._sprites.popitem(last=False)
+                self.nbytes -= old[0].get_stride() * old[0].get_height()
+        return sprite
+
+
+    def draw_layer_slices(self, cr, centers_x, center_y, length, height, width, r=0, g=0, b=0):
+        '''Same as utils.draw_layer_slices, but every slice is pasted from its sprite'''
+        matrix = cr.get_matrix()
+        scale = matrix.xx
+        cr.save()
+        cr.identity_matrix()
+        for center_x in centers_x:
+            x, y = matrix.transform_point(center_x, center_y)
+            pixel_x, pixel_y = math.floor(x), math.floor(y)
+            surface, left, top = self.get(length, height, width, r, g, b, scale, x - pixel_x, y - pixel_y)
+            cr.set_source_surface(surface, pixel_x + left, pixel_y + top)
+            cr.rectangle(pixel_x + left, pixel_y + top, surface.get_width(), surface.get_height())
+            cr.fill()
+        cr.restore()
+
+
+'''shared by all models which don't set their own (see Model.set_sprite_cache)'''
+sprites = SpriteCache()
+
+
+class SurfacePool:
+    def __init__(self, max_bytes=256*1024*1024):
+        '''
+        ImageSurfaces given back after a drawing and lent again to the next drawing of the same
+        (format, width, height), instead of allocating a new pixel buffer every time.
+
+        When the idle surfaces take more than max_bytes, the least recently given back ones are dropped.
+        It can be shared by drawings running in several threads.
+        '''
+        self.max_bytes = max_bytes
+        self.nbytes = 0 # of the idle surfaces
+        self.hits = 0
+        self.misses = 0
+        self._idle = collections.OrderedDict() # (format, width, height): [surfaces]
+        self._lock = threading.Lock()
+
+
+    def __len__(self):
+        return sum(len(surfaces) for surfaces in self._idle.values())
+
+
+    def clear(self):
+        with self._lock:
+            for surfaces in self._idle.values():
+                for surface in surfaces:
+                    surface.finish()
+            self._idle.clear()
+            self.nbytes = 0
+
+
+    def borrow(self, width, height, format=None):
+        '''an idle surface (not cleared) of width*height, or a new one (ARGB32 unless format is given)'''
+        if format is None:
+            format = cairo.FORMAT_ARGB32
+        key = (format, width, height)
+        with self._lock:
+            surfaces = self._idle.get(key)
+            if surfaces:
+                surface = surfaces.pop()
+                if not surfaces:
+                    del self._idle[key]
+                self.nbytes -= surface.get_stride() * surface.get_height()
+                self.hits += 1
+                return surface
+            self.misses += 1
+        return cairo.ImageSurface(format, width, height)
+
+
+    def give_back(self, surface):
+        '''keep a borrowed surface for the next borrow, it must not be used any more'''
+        key = (surface.get_format(), surface.get_width(), surface.get_height())
+        with self._lock:
+            self._idle.setdefault(key, []).append(surface)
+            self._idle.move_to_end(key)
+            self.nbytes += surface.get_stride() * surface.get_height()
+            while self.nbytes > self.max_bytes:
+                old_key, surfaces = next(iter(self._idle.items()))
+                old = surfaces.pop(0)
+                if not surfaces:
+                    del self._idle[old_key]
+                self.nbytes -= old.get_stride() * old.get_height()
+                old.finish()
+
+
+'''shared by all models which set a surface pool without making their own (see Model.set_surface_pool)'''
+surfaces = SurfacePool()
+
+
+'''changed whenever the same model would give a different picture, so older stored pictures are not used'''
+DISK_CACHE_VERSION = 1
+
+
+class DiskCache:
+    def __init__(self, directory, max_bytes=512*1024*1024, link=False):
+        '''
+        Pictures already drawn, stored in directory under the hash of everything they are drawn from
+        (see key), so that drawing an unchanged model again only copies the stored file to the output.
+
+        When the stored pictures take more than max_bytes, the least recently used ones are removed.
+        The directory can be shared by several threads and processes.
+        link: hard link the stored files to the outputs instead of copying them (if the file system
+        allows it). The outputs then share their content with the cache: changing one in place,
+        instead of replacing it, changes the stored picture too.
+        '''
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.link = link
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+
+    def key(self, model, output_format='png', **options):
+        '''sha256 (hex) of the canonical contents of model and of the Draw options'''
+        content = {
+            'version': DISK_CACHE_VERSION,
+            #begin_pos and center_y only depend on the rest (see Model._update_lenth)
+            'modules': [dict(item for item in module.to_dict().items() if item[0] not in ('begin_pos', 'center_y'))
+                        for module in model.modules],
+            'interval': model.module_interval,
+            'wrap': model.wrap,
+            'notes': sorted(name for name in model.use_module if model.use_module[name]),
+            'color': sorted(model.color.items()),
+            'font': [model.font, model.font_size, model.word_trans_x, model.word_trans_y],
+            'size': [model.img_w, model.img_h],
+            'sprites': model.sprite_cache is not None,
+            'incremental': model.raster is not None,
+            'format': output_format,
+            'options': sorted(options.items()),
+        }
+        data = json.dumps(content, sort_keys=True, separators=(',', ':'), default=repr)
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+    def _path(self, key, output_format):
+        return os.path.join(self.directory, key + '.' + output_format)
+
+
+    def _temporary(self, path):
+        '''a name next to path no other thread or process uses'''
+        return '%s.%d.%d.tmp' % (path, os.getpid(), threading.get_ident())
+
+
+    def _link(self, path, temporary):
+        '''hard link path to temporary, or copy it where links are not possible'''
+        try:
+            os.link(path, temporary)
+        except FileNotFoundError:
+            raise
+        except OSError:
+            shutil.copyfile(path, temporary)
+
+
+    def get(self, key, output_format, output_filename):
+        '''
+        Copy (or hard link, see link) the stored picture of key to output_filename.
+        Returns False if there is none. Then an output_filename left linked to a stored picture by
+        an earlier get is removed, so that drawing over it doesn't change the stored picture.
+        '''
+        path = self._path(key, output_format)
+        temporary = self._temporary(output_filename)
+        try:
+            if self.link:
+                self._link(path, temporary)
+            else:
+                shutil.copyfile(path, temporary)
+        except FileNotFoundError:
+            self.misses += 1
+            try:
+                if os.stat(output_filename).st_nlink > 1:
+                    os.unlink(output_filename)
+            except FileNotFoundError:
+                pass
+            return False
+        os.replace(temporary, output_filename)
+        #the least recently used pictures are the oldest ones
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        self.hits += 1
+        return True
+
+
+    def put(self, key, output_format, filename):
+        '''store a copy of the picture filename under key'''
+        path = self._path(key, output_format)
+        temporary = self._temporary(path)
+        shutil.copyfile(filename, temporary)
+        os.replace(temporary, path)
+        self._evict()
+
+
+    def _evict(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.tmp'):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        nbytes = sum(size for mtime, size, path in entries)
+        for mtime, size, path in sorted(entries):
+            if nbytes <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            nbytes -= size
+
+
+    def clear(self):
+        '''remove all the stored pictures'''
+        for entry in os.scandir(self.directory):
+            try:
+                os.unlink(entry.path)
+            except FileNotFoundError:
+                pass
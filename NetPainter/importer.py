@@ -0,0 +1,162 @@
+# Software License Agreement (MIT License)
+#
+# Copyright (C) 2019 Chuanyu Pan (pancy17@mails.tsinghua.edu.cn)
+# All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and 
+#associated documentation files (the "Software"), to deal in the Software without restriction, 
+#including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+#and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, 
+#subject to the following conditions:
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in the
+#   documentation and/or other materials provided with the distribution.
+# * Neither the name of the Tsinghua University nor the
+#   names of its contributors may be used to endorse or promote products
+#   derived from this software without specific prior written permission.
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES 
+#OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE 
+#LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR 
+#IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+'''importer (build a slices Model from a framework-neutral layer list or an ONNX file)'''
+
+import math
+from NetPainter.slices import Model
+
+'''op name (lower case) -> module function'''
+OPS = {'conv': 'Conv2d', 'conv2d': 'Conv2d',
+       'relu': 'ReLu',
+       'maxpool': 'Maxpooling', 'maxpool2d': 'Maxpooling', 'maxpooling': 'Maxpooling',
+       'bn': 'BN', 'batchnorm': 'BN', 'batchnorm2d': 'BN', 'batchnormalization': 'BN',
+       'softmax': 'Softmax',
+       'add': 'Residual', 'residual': 'Residual'}
+
+'''module functions with slice_num, identical layers in a row are drawn as slices of one module'''
+SLICED = ('Conv2d', 'Residual', 'Maxpooling', 'customize')
+
+'''ONNX ops which are not drawn'''
+ONNX_SKIP = ('Constant', 'Shape', 'Gather', 'Unsqueeze', 'Squeeze', 'Reshape', 'Flatten', 'Concat',
+             'Identity', 'Cast', 'Transpose', 'Dropout')
+
+
+def _split_shape(shape):
+    '''(res_x, res_y, channel) of a (C,), (N, C), (C, H, W) or (N, C, H, W) shape'''
+    shape = tuple(int(dim) for dim in shape)
+    if len(shape) == 4:
+        return shape[2], shape[3], shape[1]
+    if len(shape) == 3:
+        return shape[1], shape[2], shape[0]
+    if len(shape) == 2:
+        return 1, 1, shape[1]
+    if len(shape) == 1:
+        return 1, 1, shape[0]
+    raise ValueError('unsupported layer shape: %s' % (shape,))
+
+
+def _collapse(layers):
+    '''[(function, name, res_x, res_y, channel, kernel, slice_num)], identical layers in a row counted in slice_num'''
+    modules = []
+    for layer in layers:
+        op, shape = layer[0], layer[1]
+        kernel = layer[2] if len(layer) > 2 else None
+        function = OPS.get(op.lower(), 'customize')
+        name = function if function != 'customize' else op
+        res_x, res_y, channel = _split_shape(shape)
+        item = (function, name, res_x, res_y, channel, kernel)
+        if modules and tuple(modules[-1][:6]) == item and function in SLICED:
+            modules[-1][6] += 1
+        else:
+            modules.append(list(item) + [1])
+    return modules
+
+
+def from_layers(layers, img_w=2000, img_h=1000, interval=10, blank=10, fit=True, notation=True):
+    '''
+    Build a Model from a list of (op, shape) or (op, shape, kernel) tuples,
+    eg. [('conv', (1, 64, 224, 224), 3), ('relu', (1, 64, 224, 224)), ('maxpool', (1, 64, 112, 112))]
+
+    op: conv, relu, maxpool, bn, softmax, add (see OPS), other ops are drawn as customize layers named op
+    shape: The output shape, (N, C, H, W), (C, H, W), (N, C) or (C,)
+
+    The slices are sized on a log scale of the resolution and channel number so that big and small
+    layers can be seen side by side, the heights fit into img_h and, as far as possible, the total
+    length fits into img_w. Identical layers in a row are collapsed into one module with slice_num slices.
+    If fit is True, the picture is resized to the layers at the end (see Model.fit_canvas).
+    '''
+    modules = _collapse(layers)
+    model = Model(img_w=img_w, img_h=img_h, interval=interval)
+    if not modules:
+        return model
+
+    #heights: the biggest layer (with its isometric depth) takes 60% of img_h
+    max_res = max(max(module[2], module[3]) for module in modules)
+    size = 0.6 * img_h / (1 + 1/1.414) / math.log2(1 + max_res)
+
+    #widths: shrink them until the length fits into 80% of img_w (at least 0.5px per log2(channel))
+    weights = sum(math.log2(1 + module[4]) * module[6] for module in modules)
+    fixed = sum((interval * module[6]) + blank for module in modules)
+    scale = 4.0
+    if weights > 0 and fixed + scale * weights > 0.8 * img_w:
+        scale = max((0.8 * img_w - fixed) / weights, 0.5)
+
+    for function, name, res_x, res_y, channel, kernel, slice_num in modules:
+        draw_l = max(size * math.log2(1 + res_x), 2)
+        draw_h = max(size * math.log2(1 + res_y), 2)
+        draw_w = max(scale * math.log2(1 + channel), 1)
+        kwargs = dict(res_x=res_x, res_y=res_y, channel=channel, draw_h=draw_h, draw_l=draw_l, draw_w=draw_w, blank=blank)
+        if function in SLICED:
+            kwargs['slice_num'] = slice_num
+        if function in ('Conv2d', 'Residual', 'Maxpooling', 'Softmax', 'customize'):
+            kwargs['notation'] = notation
+        if function == 'Conv2d':
+            kwargs['kernel'] = kernel
+        if function == 'customize':
+            kwargs['name'] = name
+        getattr(model, function)(**kwargs)
+    if fit:
+        model.fit_canvas(margin=50)
+    return model
+
+
+def onnx_layers(path):
+    '''
+    (op, shape, kernel) of the nodes of an ONNX model file, in graph order, with shapes from the ONNX
+    shape inference. Needs the onnx package; the file is only read locally.
+    Symbolic or unknown dims (eg. a dynamic batch axis with dim_param) are taken as 1.
+    '''
+    try:
+        import onnx
+        from onnx import shape_inference
+    except ImportError:
+        raise ImportError('the onnx package is required to import ONNX files')
+    graph = shape_inference.infer_shapes(onnx.load(path)).graph
+    shapes = {}
+    for value in list(graph.input) + list(graph.value_info) + list(graph.output):
+        dims = value.type.tensor_type.shape.dim
+        if dims:
+            shapes[value.name] = tuple(dim.dim_value if dim.HasField('dim_value') else 1 for dim in dims)
+    layers = []
+    for node in graph.node:
+        if node.op_type in ONNX_SKIP or not node.output or node.output[0] not in shapes:
+            continue
+        kernel = None
+        for attribute in node.attribute:
+            if attribute.name == 'kernel_shape' and node.op_type == 'Conv':
+                kernel = tuple(attribute.ints) if len(set(attribute.ints)) > 1 else attribute.ints[0]
+        op = {'Relu': 'relu', 'MaxPool': 'maxpool', 'BatchNormalization': 'bn', 'Conv': 'conv'}.get(node.op_type, node.op_type)
+        layers.append((op, shapes[node.output[0]], kernel))
+    return layers
+
+
+def from_onnx(path, **kwargs):
+    '''Build a Model from an ONNX model file (see onnx_layers and from_layers for kwargs)'''
+    layers = onnx_layers(path)
+    if not layers:
+        raise ValueError('no drawable node with a known output shape in %s' % path)
+    return from_layers(layers, **kwargs)
@@ -0,0 +1,127 @@
+# Software License Agreement (MIT License)
+#
+# Copyright (C) 2019 Chuanyu Pan (pancy17@mails.tsinghua.edu.cn)
+# All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and 
+#associated documentation files (the "Software"), to deal in the Software without restriction, 
+#including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+#and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, 
+#subject to the following conditions:
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in the
+#   documentation and/or other materials provided with the distribution.
+# * Neither the name of the Tsinghua University nor the
+#   names of its contributors may be used to endorse or promote products
+#   derived from this software without specific prior written permission.
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES 
+#OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE 
+#LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR 
+#IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+'''instrument (opt-in timing and counting of what Draw does)'''
+
+import json
+import time
+import contextlib
+import collections
+
+
+'''cairo Context methods counted by CountingContext, and the name of their count'''
+COUNTED = {'move_to': 'paths', 'rectangle': 'paths', 'fill': 'fills', 'stroke': 'strokes', 'paint': 'paints',
+           'show_text': 'texts', 'show_glyphs': 'texts'}
+
+
+class CountingContext:
+    def __init__(self, cr, counts):
+        '''Stands for the cairo Context cr and counts the calls of COUNTED in counts (a Counter)'''
+        self._cr = cr
+        self._counts = counts
+
+
+    def __getattr__(self, name):
+        attribute = getattr(self._cr, name)
+        if name not in COUNTED:
+            return attribute
+        counts, count = self._counts, COUNTED[name]
+        def counted(*args, **kwargs):
+            counts[count] += 1
+            return attribute(*args, **kwargs)
+        return counted
+
+
+class Profiler:
+    def __init__(self, callback=None):
+        '''
+        Collects a record (a dict) for every Draw/render while it is set on a Model (see Model.profile):
+            kind : 'Draw', 'render' or 'thumbnails'
+            total : wall time of the whole call, in seconds
+            stages : wall time of every stage (add_notes, Draw_Graph, Draw_Kernel, write_text, write_to_png,
+                     raster/tiles for incremental and tiled drawing, disk_cache, see Model._paint and Draw)
+            counts : number of paths, fills, strokes, paints and texts sent to cairo
+            surface_bytes : memory of the pixel buffer
+        callback is called with every record as soon as it is finished.
+        '''
+        self.callback = callback
+        self.records = []
+        self.current = None
+
+
+    @contextlib.contextmanager
+    def draw(self, kind):
+        '''record one Draw/render'''
+        self.current = {'kind': kind, 'total': 0.0, 'stages': collections.OrderedDict(),
+                        'counts': collections.Counter(), 'surface_bytes': 0}
+        begin = time.perf_counter()
+        try:
+            yield self.current
+        finally:
+            record, self.current = self.current, None
+            record['total'] = time.perf_counter() - begin
+            record['counts'] = dict(record['counts'])
+            record['stages'] = dict(record['stages'])
+            self.records.append(record)
+            if self.callback is not None:
+                self.callback(record)
+
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        '''add the time spent in the block to the stage name of the current record'''
+        begin = time.perf_counter()
+        try:
+            yield
+        finally:
+            if self.current is not None:
+                stages = self.current['stages']
+                stages[name] = stages.get(name, 0.0) + time.perf_counter() - begin
+
+
+    def wrap(self, cr, surface=None):
+        '''count the primitives of cr (and the memory of its surface) in the current record'''
+        if self.current is None:
+            return cr
+        if surface is not None and hasattr(surface, 'get_stride'):
+            self.current['surface_bytes'] += surface.get_stride() * surface.get_height()
+        return CountingContext(cr, self.current['counts'])
+
+
+    def write_json_lines(self, fp):
+        '''write every record as a JSON line to the text file object fp'''
+        for record in self.records:
+            fp.write(json.dumps(record) + '\n')
+
+
+@contextlib.contextmanager
+def profiling(model, callback=None):
+    '''set a new Profiler on model for the block, see Model.profile'''
+    profiler, model.profiler = model.profiler, Profiler(callback)
+    try:
+        yield model.profiler
+    finally:
+        model.profiler = profiler
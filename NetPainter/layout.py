@@ -0,0 +1,97 @@
+# Software License Agreement (MIT License)
+#
+# Copyright (C) 2019 Chuanyu Pan (pancy17@mails.tsinghua.edu.cn)
+# All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and 
+#associated documentation files (the "Software"), to deal in the Software without restriction, 
+#including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+#and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, 
+#subject to the following conditions:
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in the
+#   documentation and/or other materials provided with the distribution.
+# * Neither the name of the Tsinghua University nor the
+#   names of its contributors may be used to endorse or promote products
+#   derived from this software without specific prior written permission.
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES 
+#OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE 
+#LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR 
+#IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+'''layout (slice geometry of a whole Model, computed with numpy)'''
+
+from NetPainter.lazy import numpy as np # optional, Model falls back to utils.draw_layer_slices
+
+
+class Layout:
+    def __init__(self, model):
+        '''
+        Geometry of every slice of a Model, computed in one vectorized pass.
+
+        Slices of all modules are stored one after another (an Encoder counts as one slice),
+        the slices of the i'th module are slices(i).
+        center_x/center_y : left-side face center position of every slice
+        front : (x, y, width, height) rectangle of the front faces, shape (N, 4)
+        top/side : four corner points of the top/side faces, shape (N, 4, 2)
+        bbox : (x0, y0, x1, y1) bounding box of every slice, shape (N, 4)
+        '''
+        if not np.available():
+            raise ImportError('numpy is required to compute a Layout')
+        modules = model.modules
+        draw_l = np.array([module.draw_l for module in modules], dtype=float)
+        draw_h = np.array([module.draw_h for module in modules], dtype=float)
+        draw_w = np.array([module.draw_w for module in modules], dtype=float)
+        slice_num = np.array([1 if module.name=='Encoder' else module.slice_num for module in modules], dtype=int)
+
+        '''module positions, set by Model._update_lenth (rows may be wrapped)'''
+        self.begin_pos = np.array([module.begin_pos for module in modules], dtype=float)
+        self.center_y_module = np.array([module.center_y for module in modules], dtype=float)
+
+        '''slice positions'''
+        self.starts = np.concatenate(([0], np.cumsum(slice_num)))
+        self.module_index = np.repeat(np.arange(len(modules)), slice_num)
+        idx = self.module_index
+        order = np.arange(self.starts[-1]) - self.starts[:-1][idx]
+        self.center_x = self.begin_pos[idx] + (draw_w[idx] + model.module_interval) * order
+        self.center_y = self.center_y_module[idx]
+
+        '''corners, see utils._slice_faces'''
+        l, h, w = draw_l[idx], draw_h[idx], draw_w[idx]
+        a = l/2.828
+        top_y = self.center_y-h/2-a
+        middle_y = self.center_y-h/2+a
+        bottom_y = self.center_y+h/2+a
+        side_y = self.center_y+h/2-a
+        left_x = self.center_x-a+w
+        right_x = self.center_x+a+w
+        self.front = np.stack([left_x-w, middle_y, w, h], axis=1)
+        self.top = np.stack([left_x-w, middle_y, right_x-w, top_y, right_x, top_y, left_x, middle_y], axis=1).reshape(-1, 4, 2)
+        self.side = np.stack([left_x, bottom_y, left_x, middle_y, right_x, top_y, right_x, side_y], axis=1).reshape(-1, 4, 2)
+        self.bbox = np.stack([self.center_x-a, top_y, right_x, bottom_y], axis=1)
+
+
+    def __len__(self):
+        return int(self.starts[-1])
+
+
+    def slices(self, index):
+        '''index range of the slices of the index'th module'''
+        return slice(int(self.starts[index]), int(self.starts[index+1]))
+
+
+    def faces(self, index):
+        '''(fronts, tops, sides) of the index'th module as lists, ready for utils.fill_slice_faces'''
+        s = self.slices(index)
+        return self.front[s].tolist(), self.top[s].tolist(), self.side[s].tolist()
+
+
+    def arrays(self):
+        '''all the arrays by name, eg. for numpy.savez(filename, **layout.arrays())'''
+        return {'starts': self.starts, 'module_index': self.module_index, 'center_x': self.center_x, 'center_y': self.center_y,
+                'front': self.front, 'top': self.top, 'side': self.side, 'bbox': self.bbox}
@@ -0,0 +1,68 @@
+# Software License Agreement (MIT License)
+#
+# Copyright (C) 2019 Chuanyu Pan (pancy17@mails.tsinghua.edu.cn)
+# All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and 
+#associated documentation files (the "Software"), to deal in the Software without restriction, 
+#including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+#and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, 
+#subject to the following conditions:
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in the
+#   documentation and/or other materials provided with the distribution.
+# * Neither the name of the Tsinghua University nor the
+#   names of its contributors may be used to endorse or promote products
+#   derived from this software without specific prior written permission.
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES 
+#OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE 
+#LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR 
+#IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+'''lazy (modules imported only when they are used)'''
+
+import importlib
+
+
+class LazyModule:
+    def __init__(self, name):
+        '''
+        Stands for the module name, which is imported the first time one of its attributes is used.
+        Building models and computing plain layouts use neither cairo nor numpy, so they are only
+        loaded to draw (or to get numpy arrays).
+        '''
+        self._name = name
+        self._module = None
+        self._missing = False
+
+
+    def _load(self):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return self._module
+
+
+    def available(self):
+        '''whether the module can be imported (it is then imported), for optional modules'''
+        if self._module is None and not self._missing:
+            try:
+                self._load()
+            except ImportError:
+                self._missing = True
+        return self._module is not None
+
+
+    def __getattr__(self, attribute):
+        return getattr(self._load(), attribute)
+
+
+    def __repr__(self):
+        return '<lazy module %r%s>' % (self._name, '' if self._module is None else ' (loaded)')
+
+
+cairo = LazyModule('cairo')
+numpy = LazyModule('numpy') # optional, see available
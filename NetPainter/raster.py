@@ -0,0 +1,215 @@
+# Software License Agreement (MIT License)
+#
+# Copyright (C) 2019 Chuanyu Pan (pancy17@mails.tsinghua.edu.cn)
+# All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and 
+#associated documentation files (the "Software"), to deal in the Software without restriction, 
+#including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+#and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, 
+#subject to the following conditions:
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in the
+#   documentation and/or other materials provided with the distribution.
+# * Neither the name of the Tsinghua University nor the
+#   names of its contributors may be used to endorse or promote products
+#   derived from this software without specific prior written permission.
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES 
+#OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE 
+#LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR 
+#IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+'''raster (cached rasters of the parts of a Model, for repeated Draw)'''
+
+import math
+from NetPainter.lazy import cairo
+import NetPainter.text as text
+
+
+def _rasterize(model, bbox, draw):
+    '''
+    Run draw() with model.cr on a small transparent surface covering bbox (x0, y0, x1, y1)
+    Returns (surface, x, y), the surface goes to (x, y) on the picture.
+    '''
+    x = int(math.floor(bbox[0])) - 2
+    y = int(math.floor(bbox[1])) - 2
+    width = max(int(math.ceil(bbox[2])) + 2 - x, 1)
+    height = max(int(math.ceil(bbox[3])) + 2 - y, 1)
+    surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, width, height)
+    cr, model.cr = model.cr, cairo.Context(surface)
+    try:
+        model.cr.translate(-x, -y)
+        draw()
+    finally:
+        model.cr = cr
+    return surface, x, y
+
+
+class RasterCache:
+    def __init__(self):
+        '''
+        Rasters of the notes, of every module and of every notation of a Model, so that a new Draw
+        only redraws the parts which have changed (eg. after set_color, set_font or a new layer) and
+        composites the others again.
+
+        Every raster is kept with the key of what it shows. Modules and notations are placed relative
+        to their module, so they are reused when the graph is moved to the center again after a new
+        layer; they are then placed on whole pixels (at most half a pixel away from a full Draw).
+        Only the regions of the picture where something changed are composited again.
+        '''
+        self.canvas = None
+        self.notes = None   # (key, surface, dx, dy) relative to the right-bottom corner
+        self.connectors = None # (key, surface, x, y) of the connectors between rows
+        self.modules = []   # (key, surface, dx, dy) relative to (begin_pos, center_y) of the module
+        self.kernels = []   # same as modules, None if the module has no kernel
+        self.texts = []     # same as modules, None if the module has no notation
+        self.placed = []    # (surface, x, y) composited on canvas, in painting order
+
+
+    def _notes(self, model):
+        names = [name for name in model.use_module if model.use_module[name]]
+        key = (tuple((name, model.color[name]) for name in names), model.font)
+        if self.notes is None or self.notes[0] != key:
+            if names:
+                advance = max(text.cache.extents(model.font, 40, name)[4] for name in names)
+                bbox = (model.img_w-315, model.img_h-145-80*(len(names)-1), model.img_w-195+advance, model.img_h-70)
+                surface, x, y = _rasterize(model, bbox, model._add_notes)
+                self.notes = (key, surface, x - model.img_w, y - model.img_h)
+            else:
+                self.notes = (key, None, 0, 0)
+        key, surface, dx, dy = self.notes
+        return [] if surface is None else [(surface, model.img_w + dx, model.img_h + dy)]
+
+
+    def _connectors(self, model):
+        '''the connectors between rows (see Model.set_wrap), drawn again whenever the rows change'''
+        if len(model.rows) < 2:
+            self.connectors = None
+            return []
+        key = tuple((module.begin_pos, module.center_y, model._module_bbox(module)) for module in model.modules)
+        if self.connectors is None or self.connectors[0] != key:
+            bboxes = [model._module_bbox(module) for module in model.modules]
+            bbox = (min(box[0] for box in bboxes) - 40, min(module.center_y for module in model.modules) - 20,
+                    max(box[2] for box in bboxes) + 40, max(box[3] for box in bboxes) + 20)
+            surface, x, y = _rasterize(model, bbox, model._Draw_Connectors)
+            self.connectors = (key, surface, x, y)
+        key, surface, x, y = self.connectors
+        return [(surface, x, y)]
+
+
+    def _graph(self, model):
+        slices = model._get_slices()
+        del self.modules[len(model.modules):]
+        placed = []
+        for index, module in enumerate(model.modules):
+            center_y = module.center_y
+            #not the position: a moved module is pasted again at the nearest whole pixel
+            fields = tuple(value for name, value in module.items() if name not in ('begin_pos_origin', 'begin_pos', 'center_y'))
+            key = (fields, model.color[module.name], model.module_interval)
+            if index == len(self.modules) or self.modules[index][0] != key:
+                surface, x, y = _rasterize(model, model._module_bbox(module), lambda: model._Draw_Module(index, module, slices))
+                entry = (key, surface, x - module.begin_pos, y - center_y)
+                if index == len(self.modules):
+                    self.modules.append(entry)
+                else:
+                    self.modules[index] = entry
+            key, surface, dx, dy = self.modules[index]
+            placed.append((surface, int(round(module.begin_pos + dx)), int(round(center_y + dy))))
+        return placed
+
+
+    def _kernels(self, model):
+        '''the kernels over the modules, kept apart as they are painted over all the layers'''
+        del self.kernels[len(model.modules):]
+        placed = []
+        for index, module in enumerate(model.modules):
+            if index == len(self.kernels):
+                self.kernels.append(None)
+            bbox = model._kernel_bbox(module)
+            if bbox is None:
+                self.kernels[index] = None
+                continue
+            fields = tuple(value for name, value in module.items() if name not in ('begin_pos_origin', 'begin_pos', 'center_y'))
+            key = (fields, model.module_interval)
+            if self.kernels[index] is None or self.kernels[index][0] != key:
+                surface, x, y = _rasterize(model, bbox, lambda: model._Draw_Kernels([index]))
+                self.kernels[index] = (key, surface, x - module.begin_pos, y - module.center_y)
+            key, surface, dx, dy = self.kernels[index]
+            placed.append((surface, int(round(module.begin_pos + dx)), int(round(module.center_y + dy))))
+        return placed
+
+
+    def _text(self, model):
+        del self.texts[len(model.modules):]
+        placed = []
+        for index, module in enumerate(model.modules):
+            center_y = module.center_y
+            if index == len(self.texts):
+                self.texts.append(None)
+            if module.notation != True:
+                self.texts[index] = None
+                continue
+            context, pos_x, pos_y = model._text_notation(module)
+            key = (context, model.font, model.font_size, pos_x - module.begin_pos, pos_y - center_y)
+            if self.texts[index] is None or self.texts[index][0] != key:
+                x_bearing, y_bearing, width, height = text.cache.extents(model.font, model.font_size, context)[:4]
+                bbox = (pos_x + x_bearing, pos_y + y_bearing, pos_x + x_bearing + width, pos_y + y_bearing + height)
+                def write():
+                    model.cr.set_source_rgb(0, 0, 0)
+                    text.cache.show_texts(model.cr, model.font, model.font_size, [(context, pos_x, pos_y)])
+                surface, x, y = _rasterize(model, bbox, write)
+                self.texts[index] = (key, surface, x - module.begin_pos, y - center_y)
+            key, surface, dx, dy = self.texts[index]
+            placed.append((surface, int(round(module.begin_pos + dx)), int(round(center_y + dy))))
+        return placed
+
+
+    def draw(self, model, add_note=True, add_para=True):
+        '''
+        Bring the rasters up to date with model and composite them on the picture.
+        Returns the picture, an ImageSurface which is kept (and changed) for the next draw.
+        '''
+        model._update_lenth()
+        placed = []
+        if add_note:
+            placed += self._notes(model)
+        placed += self._connectors(model)
+        placed += self._graph(model)
+        placed += self._kernels(model)
+        if add_para:
+            placed += self._text(model)
+
+        if self.canvas is None or (self.canvas.get_width(), self.canvas.get_height()) != (model.img_w, model.img_h):
+            self.canvas = cairo.ImageSurface(cairo.FORMAT_ARGB32, model.img_w, model.img_h)
+            damaged = [(0, 0, model.img_w, model.img_h)]
+        else:
+            #surfaces are compared by id, both lists keep them alive
+            old = dict(((id(surface), x, y), surface) for surface, x, y in self.placed)
+            new = dict(((id(surface), x, y), surface) for surface, x, y in placed)
+            damaged = [(x, y, x + surface.get_width(), y + surface.get_height())
+                       for (_, x, y), surface in [(item, old[item]) for item in old if item not in new] +
+                                                  [(item, new[item]) for item in new if item not in old]]
+        self.placed = placed
+        if not damaged:
+            return self.canvas
+
+        cr = cairo.Context(self.canvas)
+        for x0, y0, x1, y1 in damaged:
+            cr.rectangle(x0, y0, x1 - x0, y1 - y0)
+        cr.clip()
+        cr.set_operator(cairo.OPERATOR_CLEAR)
+        cr.paint()
+        cr.set_operator(cairo.OPERATOR_OVER)
+        for surface, x, y in placed:
+            x1, y1 = x + surface.get_width(), y + surface.get_height()
+            if any(x < dx1 and dx0 < x1 and y < dy1 and dy0 < y1 for dx0, dy0, dx1, dy1 in damaged):
+                cr.set_source_surface(surface, x, y)
+                cr.rectangle(x, y, x1 - x, y1 - y)
+                cr.fill()
+        self.canvas.flush()
+        return self.canvas
@@ -0,0 +1,82 @@
+# Software License Agreement (MIT License)
+#
+# Copyright (C) 2019 Chuanyu Pan (pancy17@mails.tsinghua.edu.cn)
+# All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and 
+#associated documentation files (the "Software"), to deal in the Software without restriction, 
+#including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+#and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, 
+#subject to the following conditions:
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in the
+#   documentation and/or other materials provided with the distribution.
+# * Neither the name of the Tsinghua University nor the
+#   names of its contributors may be used to endorse or promote products
+#   derived from this software without specific prior written permission.
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES 
+#OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE 
+#LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR 
+#IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+'''renderer (draw many models at once from several threads)'''
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+import NetPainter.cache as cache
+
+
+class Renderer:
+    def __init__(self, workers=None, surface_pool=None):
+        '''
+        Render independent Models concurrently in a pool of workers threads (cairo lets go of
+        the GIL while it draws, so the threads use several cores).
+
+        The pictures are drawn on ImageSurfaces borrowed from surface_pool (a cache.SurfacePool,
+        by default a new one of 256MB) and given back after every render.
+        The font and sprite caches (text.cache, cache.sprites) are shared by all the threads, they are
+        bounded LRUs, so rendering at ever new scales doesn't make them grow.
+        A Model must not be rendered by two threads at the same time.
+        '''
+        self.workers = workers or os.cpu_count() or 1
+        self.surface_pool = cache.SurfacePool() if surface_pool is None else surface_pool
+        self._executor = ThreadPoolExecutor(self.workers)
+
+
+    def render(self, model, add_note=True, add_para=True, margin=None, viewport=None, scale=1.0, lod=None):
+        '''Draw model in the calling thread and return the PNG file as bytes (see Model.render)'''
+        if margin is not None:
+            model.fit_canvas(margin, add_note)
+        surface = self.surface_pool.borrow(*model.surface_size(viewport, scale))
+        try:
+            return model.render(add_note, add_para, viewport=viewport, scale=scale, surface=surface, lod=lod)
+        finally:
+            self.surface_pool.give_back(surface)
+
+
+    def submit(self, model, **kwargs):
+        '''render model in a worker thread, returns a Future of the PNG bytes'''
+        return self._executor.submit(self.render, model, **kwargs)
+
+
+    def map(self, models, **kwargs):
+        '''PNG bytes of every model, in order, rendered by the worker threads'''
+        return self._executor.map(lambda model: self.render(model, **kwargs), models)
+
+
+    def close(self):
+        '''wait for the renders and release the threads and the surfaces'''
+        self._executor.shutdown()
+        self.surface_pool.clear()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc_info):
+        self.close()
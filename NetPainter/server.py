@@ -0,0 +1,257 @@
+# Software License Agreement (MIT License)
+#
+# Copyright (C) 2019 Chuanyu Pan (pancy17@mails.tsinghua.edu.cn)
+# All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and 
+#associated documentation files (the "Software"), to deal in the Software without restriction, 
+#including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+#and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, 
+#subject to the following conditions:
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in the
+#   documentation and/or other materials provided with the distribution.
+# * Neither the name of the Tsinghua University nor the
+#   names of its contributors may be used to endorse or promote products
+#   derived from this software without specific prior written permission.
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES 
+#OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE 
+#LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR 
+#IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+'''
+server (draw model specs sent over HTTP): python -m NetPainter.server [--port 8000]
+
+    POST /render   a model spec (see spec.py) as JSON, answers the picture (png unless
+                   "draw": {"output_format": ...} says otherwise)
+    GET /metrics   counters, queue depth and latencies as JSON
+'''
+
+import io
+import os
+import sys
+import json
+import time
+import asyncio
+import hashlib
+import argparse
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+import NetPainter.cache as cache
+from NetPainter.spec import build_model, draw_options
+
+CONTENT_TYPES = {'png': 'image/png', 'svg': 'image/svg+xml', 'pdf': 'application/pdf', 'ps': 'application/postscript'}
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large',
+           500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+
+def check_spec(spec, max_pixels=None, max_layers=None):
+    '''raise ValueError if a posted spec is not a dict or asks for a picture or a model too big'''
+    if not isinstance(spec, dict):
+        raise ValueError('a model spec must be a dict with a "layers" list')
+    if max_layers is not None and isinstance(spec.get('layers'), list) and len(spec['layers']) > max_layers:
+        raise ValueError('more than %d layers' % max_layers)
+    sizes = dict((key, spec[key]) for key in ('img_w', 'img_h') if key in spec)
+    if isinstance(spec.get('draw'), dict) and spec['draw'].get('margin') is not None:
+        sizes['margin'] = spec['draw']['margin']
+    for key, value in sizes.items():
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not 0 <= value < float('inf'):
+            raise ValueError('%s must be a number >= 0' % key)
+    if max_pixels is not None and spec.get('img_w', 1000) * spec.get('img_h', 1000) > max_pixels:
+        raise ValueError('the picture is bigger than %d pixels' % max_pixels)
+
+
+def draw_spec(spec, max_pixels=None):
+    '''
+    (output_format, content) of the picture of a spec, drawn in memory
+    raise ValueError if the picture (fitted to the layers with the margin of the spec) is bigger than max_pixels
+    '''
+    model = build_model(spec)
+    model.set_surface_pool(cache.surfaces)
+    options = draw_options(spec)
+    output_format = options.pop('output_format', None) or 'png'
+    margin = options.pop('margin', None)
+    if margin is not None:
+        model.fit_canvas(margin, options.get('add_note', True))
+    width, height = model.surface_size()
+    if max_pixels is not None and width * height > max_pixels:
+        raise ValueError('the picture would be %dx%d, bigger than %d pixels' % (width, height, max_pixels))
+    buffer = io.BytesIO()
+    model.Draw(buffer, output_format=output_format, **options)
+    return output_format, buffer.getvalue()
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else None
+
+
+class RenderServer:
+    def __init__(self, workers=None, max_queue=64, max_body=1024*1024, window=1024, max_pixels=4096*4096, max_layers=1000):
+        '''
+        Draw the specs posted to /render in a pool of workers threads, without blocking the event loop.
+
+        Identical specs posted while one of them is drawn wait for that picture instead of drawing it again.
+        When max_queue different specs are already waiting or being drawn, new ones are answered 503.
+        Specs with more than max_layers layers or pictures bigger than max_pixels are answered 400.
+        The latencies of the last window requests are kept for /metrics.
+        '''
+        self.max_queue = max_queue
+        self.max_body = max_body
+        self.max_pixels = max_pixels
+        self.max_layers = max_layers
+        self.executor = ThreadPoolExecutor(workers or os.cpu_count() or 1)
+        self.counters = collections.Counter()
+        self.latencies = collections.deque(maxlen=window)       # seconds from request to answer
+        self.draw_latencies = collections.deque(maxlen=window)  # seconds of drawing
+        self._running = {} # spec hash: asyncio.Future of (output_format, content)
+
+
+    def metrics(self):
+        '''counters, queue depth and latencies (mean, p50, p95, max in seconds)'''
+        metrics = dict(self.counters)
+        metrics['queue_depth'] = len(self._running)
+        metrics['max_queue'] = self.max_queue
+        for name, values in (('latency', self.latencies), ('draw_latency', self.draw_latencies)):
+            metrics[name] = {
+                'count': len(values),
+                'mean': sum(values) / len(values) if values else None,
+                'p50': _percentile(values, 0.5),
+                'p95': _percentile(values, 0.95),
+                'max': max(values) if values else None,
+            }
+        return metrics
+
+
+    async def _draw(self, spec):
+        begin = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, draw_spec, spec, self.max_pixels)
+        finally:
+            self.draw_latencies.append(time.perf_counter() - begin)
+
+
+    async def render(self, spec):
+        '''
+        (output_format, content) of the picture of spec, shared with the identical specs being drawn.
+        Returns None if the queue is full.
+        '''
+        key = hashlib.sha256(json.dumps(spec, sort_keys=True).encode('utf-8')).hexdigest()
+        future = self._running.get(key)
+        if future is not None:
+            self.counters['coalesced'] += 1
+        else:
+            if len(self._running) >= self.max_queue:
+                return None
+            self.counters['drawn'] += 1
+            future = asyncio.ensure_future(self._draw(spec))
+            self._running[key] = future
+            future.add_done_callback(lambda done: self._running.pop(key, None))
+        #a client going away must not cancel the drawing for the others
+        return await asyncio.shield(future)
+
+
+    async def _respond(self, method, path, body):
+        '''(status, content type, content) of a request'''
+        if path == '/metrics':
+            if method != 'GET':
+                return 405, 'text/plain', b''
+            return 200, 'application/json', json.dumps(self.metrics()).encode('utf-8')
+        if path != '/render':
+            return 404, 'text/plain', b''
+        if method != 'POST':
+            return 405, 'text/plain', b''
+        try:
+            spec = json.loads(body.decode('utf-8'))
+            check_spec(spec, self.max_pixels, self.max_layers)
+            draw_options(spec)
+        except ValueError as e:
+            return 400, 'application/json', json.dumps({'error': str(e)}).encode('utf-8')
+        try:
+            result = await self.render(spec)
+        except ValueError as e:
+            return 400, 'application/json', json.dumps({'error': str(e)}).encode('utf-8')
+        except Exception as e:
+            self.counters['errors'] += 1
+            return 500, 'application/json', json.dumps({'error': '%s: %s' % (type(e).__name__, e)}).encode('utf-8')
+        if result is None:
+            self.counters['rejected'] += 1
+            return 503, 'application/json', json.dumps({'error': 'too many pictures waiting'}).encode('utf-8')
+        output_format, content = result
+        return 200, CONTENT_TYPES[output_format], content
+
+
+    async def handle(self, reader, writer):
+        '''answer one HTTP/1.1 request on a connection, then close it'''
+        begin = time.perf_counter()
+        try:
+            request_line = await reader.readline()
+            method, path = request_line.decode('latin-1').split()[:2]
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+            length = int(headers.get('content-length', 0))
+            if length > self.max_body:
+                status, content_type, content = 413, 'text/plain', b''
+            else:
+                body = await reader.readexactly(length)
+                self.counters['requests'] += 1
+                status, content_type, content = await self._respond(method, path.split('?')[0], body)
+        except (ValueError, asyncio.IncompleteReadError):
+            status, content_type, content = 400, 'text/plain', b''
+        head = 'HTTP/1.1 %d %s\r\nContent-Type: %s\r\nContent-Length: %d\r\nConnection: close\r\n' % (
+            status, REASONS[status], content_type, len(content))
+        if status == 503:
+            head += 'Retry-After: 1\r\n'
+        try:
+            writer.write(head.encode('latin-1') + b'\r\n' + content)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+        self.counters['status_%d' % status] += 1
+        self.latencies.append(time.perf_counter() - begin)
+
+
+    async def serve(self, host='127.0.0.1', port=8000):
+        '''answer requests until cancelled'''
+        server = await asyncio.start_server(self.handle, host, port)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.executor.shutdown()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m NetPainter.server', description='Draw network diagrams posted over HTTP.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('-p', '--port', type=int, default=8000)
+    parser.add_argument('-w', '--workers', type=int, default=None, help='number of drawing threads (default: number of cpus)')
+    parser.add_argument('-q', '--max-queue', type=int, default=64,
+                        help='different specs waiting or being drawn before answering 503 (default 64)')
+    parser.add_argument('--max-pixels', type=int, default=4096*4096,
+                        help='biggest picture drawn, in pixels, bigger ones are answered 400 (default 4096*4096)')
+    parser.add_argument('--max-layers', type=int, default=1000,
+                        help='most layers in a spec, more are answered 400 (default 1000)')
+    args = parser.parse_args(argv)
+    try:
+        server = RenderServer(args.workers, args.max_queue, max_pixels=args.max_pixels, max_layers=args.max_layers)
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
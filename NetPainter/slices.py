@@ -26,12 +26,128 @@
 
 '''A network drawer in the style of slices'''
 
+import io
+import os
 import math
-import cairo
+import contextlib
+from NetPainter.lazy import cairo
 import NetPainter.utils as utils
+import NetPainter.text as text
+import NetPainter.layout as layout
+import NetPainter.raster as raster
+import NetPainter.tiles as tiles
+import NetPainter.instrument as instrument
+
+'''slices of a Conv2d the kernel can be shown on'''
+KERNEL_AT = ('first', 'last', 'every')
+
+'''cairo surfaces of the vector output formats'''
+VECTOR_SURFACES = {'svg': 'SVGSurface', 'pdf': 'PDFSurface', 'ps': 'PSSurface'}
+
+
+def _output_format(output_filename, output_format=None):
+    '''
+    picture format given by output_format, or else by the extension of output_filename:
+    svg/pdf/ps for these extensions, png for any other one (as Draw always did)
+    '''
+    if output_format is None:
+        if isinstance(output_filename, (str, bytes, os.PathLike)):
+            extension = os.path.splitext(os.fsdecode(output_filename))[1].lstrip('.').lower()
+            return extension if extension in VECTOR_SURFACES else 'png'
+        return 'png'
+    output_format = output_format.lower()
+    if output_format != 'png' and output_format not in VECTOR_SURFACES:
+        raise ValueError('unknown output format: %s' % output_format)
+    return output_format
+
+
+class Layer:
+    '''
+    Information of a module, as a compact record.
+
+    It still behaves like the dict it replaces, so Model[i]['draw_w'] and Model[i].draw_w both work,
+    but it only has the fields of __slots__ (setting another key raises KeyError) and it is not a dict
+    for json and the like, use to_dict for that.
+    '''
+    __slots__ = ('name', 'begin_pos_origin', 'begin_pos', 'center_y', 'res_x', 'res_y', 'channel', 'kernel', 'kernel_at',
+                 'slice_num', 'draw_h', 'draw_l', 'draw_w', 'blank', 'notation')
+
+    def __init__(self, name, begin_pos, res_x=0, res_y=0, channel=0, kernel=None, kernel_at='first', slice_num=1,
+                 draw_h=0, draw_l=0, draw_w=0, blank=10, notation=True):
+        self.name=name
+        self.begin_pos_origin=begin_pos
+        self.begin_pos=begin_pos
+        self.center_y=None # set with begin_pos by Model._update_lenth
+        self.res_x=res_x
+        self.res_y=res_y
+        self.channel=channel
+        self.kernel=kernel
+        self.kernel_at=kernel_at
+        self.slice_num=slice_num
+        self.draw_h=draw_h
+        self.draw_l=draw_l
+        self.draw_w=draw_w
+        self.blank=blank
+        self.notation=notation
+
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+
+    def __setitem__(self, key, value):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+
+    def __contains__(self, key):
+        return key in self.__slots__
+
+
+    def __iter__(self):
+        return iter(self.__slots__)
+
+
+    def __len__(self):
+        return len(self.__slots__)
+
+
+    def __eq__(self, other):
+        if not hasattr(other, 'items'):
+            return NotImplemented
+        return dict(self.items()) == dict(other.items())
+
+
+    def __repr__(self):
+        return 'Layer(%s)' % ', '.join('%s=%r' % item for item in self.items())
+
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self.__slots__ else default
+
+
+    def keys(self):
+        return list(self.__slots__)
+
+
+    def values(self):
+        return [getattr(self, key) for key in self.__slots__]
+
+
+    def items(self):
+        return [(key, getattr(self, key)) for key in self.__slots__]
+
+
+    def to_dict(self):
+        '''the fields as a plain dict (a tuple kernel is a list), eg. for json.dump'''
+        return dict((key, list(value) if isinstance(value, tuple) else value) for key, value in self.items())
+
 
 class Model:
-    def __init__(self, img_w=1000, img_h=1000, interval=10):
+    def __init__(self, img_w=1000, img_h=1000, interval=10, incremental=False):
         '''
         Model is the base of your net graph. 
 
@@ -42,13 +158,23 @@ class Model:
         in order to adjust the graph to a proper position.
 
         interval is used to set the distance between layers.
+
+        incremental: If it's set to True, the drawn parts are kept (see raster.RasterCache), 
+        and the next PNG Draw/render only redraws what has changed since.
         '''
         self.img_w=img_w
         self.img_h=img_h
 
-        '''set drawing surface'''
-        self.ims = cairo.ImageSurface(cairo.FORMAT_ARGB32, self.img_w, self.img_h)
-        self.cr = cairo.Context(self.ims)
+        '''drawing surface, created only while Draw is running (see _create_surface)'''
+        self.ims = None
+        self.cr = None
+        self.view = None # (x0, y0, x1, y1) of the picture shown on the surface, see _visible
+        self.lod = None # pixels under which details are simplified while painting, see _detail
+        self.raster = raster.RasterCache() if incremental else None
+        self.sprite_cache = None
+        self.surface_pool = None
+        self.disk_cache = None
+        self.profiler = None # see profile
 
         '''set module'''
         self.module_num=0
@@ -56,6 +182,8 @@ class Model:
         self.module_interval=interval
         self.lenth=0 # Total length of the network 
         self.half_lenth=self.lenth/2
+        self.wrap=None # see set_wrap
+        self.rows=[] # module indices of every row, set by _update_lenth
         self.use_module={'Softmax':False, 'ReLu':False, 'Conv2d':False, 'BN':False, 'Residual':False, 'Maxpooling':False, 'Encoder':False}
 
         '''font settings'''
@@ -69,7 +197,7 @@ class Model:
 
 
     def __len__(self):
-        return self.lenth
+        return len(self.modules)
  
 
     def __getitem__(self, item):
@@ -105,27 +233,15 @@ class Model:
         notation: If it's set to True, the parameter information will be shown on the top of the layer
         '''
         draw_h, draw_l, draw_w = self._Auto_Set(res_x=res_x, res_y=res_y, channel=channel, draw_h=draw_h, draw_l=draw_l, draw_w=draw_w)
-        properti={}
-        properti['name']=name
-        properti['begin_pos_origin']=self.lenth
-        properti['begin_pos']=self.lenth
-        properti['res_x']=res_x
-        properti['res_y']=res_y
-        properti['channel']=channel
-        properti['slice_num']=slice_num
-        properti['draw_h']=draw_h
-        properti['draw_l']=draw_l
-        properti['draw_w']=draw_w
-        properti['blank']=blank
-        properti['notation']=notation
+        layer=Layer(name, self.lenth, res_x=res_x, res_y=res_y, channel=channel, slice_num=slice_num, draw_h=draw_h, draw_l=draw_l, draw_w=draw_w, blank=blank, notation=notation)
         self.lenth += (draw_w + self.module_interval) * slice_num + blank - self.module_interval
-        self.modules.append(properti)
+        self.modules.append(layer)
         self.module_num += 1
         self.use_module[name]=True
         self.color[name]=(r, g, b)
 
 
-    def Conv2d(self, res_x=0, res_y=0, channel=0, kernel=None, slice_num=1, has_ReLu=False, draw_h=None, draw_l=None, draw_w=None, blank=10, notation=True):
+    def Conv2d(self, res_x=0, res_y=0, channel=0, kernel=None, slice_num=1, has_ReLu=False, draw_h=None, draw_l=None, draw_w=None, blank=10, notation=True, kernel_at='first'):
         '''
         A 2d convolution layer generator
 
@@ -137,24 +253,14 @@ class Model:
         draw_h/draw_l/draw_w : The height/length/width of a layer you want to draw
         blank: Distance between this module and the next one.
         notation: If it's set to True, the parameter information will be shown on the top of the layer
+        kernel_at: The slice(s) the kernel is shown on: 'first', 'last' or 'every'
         '''
+        if kernel_at not in KERNEL_AT:
+            raise ValueError('kernel_at must be one of %s' % (KERNEL_AT,))
         draw_h, draw_l, draw_w = self._Auto_Set(res_x=res_x, res_y=res_y, channel=channel, draw_h=draw_h, draw_l=draw_l, draw_w=draw_w)
-        properti={}
-        properti['name']='Conv2d'
-        properti['begin_pos_origin']=self.lenth
-        properti['begin_pos']=self.lenth
-        properti['res_x']=res_x
-        properti['res_y']=res_y
-        properti['channel']=channel
-        properti['kernel']=kernel
-        properti['slice_num']=slice_num
-        properti['draw_h']=draw_h
-        properti['draw_l']=draw_l
-        properti['draw_w']=draw_w
-        properti['blank']=blank
-        properti['notation']=notation
+        layer=Layer('Conv2d', self.lenth, res_x=res_x, res_y=res_y, channel=channel, kernel=kernel, kernel_at=kernel_at, slice_num=slice_num, draw_h=draw_h, draw_l=draw_l, draw_w=draw_w, blank=blank, notation=notation)
         self.lenth += (draw_w + self.module_interval) * slice_num
-        self.modules.append(properti)
+        self.modules.append(layer)
         self.module_num += 1
         self.use_module['Conv2d']=True
         if has_ReLu: # add a ReLu layer
@@ -168,21 +274,9 @@ class Model:
         A Residual block generator
         '''
         draw_h, draw_l, draw_w = self._Auto_Set(res_x=res_x, res_y=res_y, channel=channel, draw_h=draw_h, draw_l=draw_l, draw_w=draw_w)
-        properti={}
-        properti['name']='Residual'
-        properti['begin_pos_origin']=self.lenth
-        properti['begin_pos']=self.lenth
-        properti['res_x']=res_x
-        properti['res_y']=res_y
-        properti['channel']=channel
-        properti['slice_num']=slice_num
-        properti['draw_h']=draw_h
-        properti['draw_l']=draw_l
-        properti['draw_w']=draw_w
-        properti['blank']=blank
-        properti['notation']=notation
+        layer=Layer('Residual', self.lenth, res_x=res_x, res_y=res_y, channel=channel, slice_num=slice_num, draw_h=draw_h, draw_l=draw_l, draw_w=draw_w, blank=blank, notation=notation)
         self.lenth += (draw_w + self.module_interval) * slice_num  + blank - self.module_interval
-        self.modules.append(properti)
+        self.modules.append(layer)
         self.module_num += 1
         self.use_module['Residual']=True
 
@@ -192,21 +286,9 @@ class Model:
         A Maxpooling generator
         '''
         draw_h, draw_l, draw_w = self._Auto_Set(res_x=res_x, res_y=res_y, channel=channel, draw_h=draw_h, draw_l=draw_l, draw_w=draw_w)
-        properti={}
-        properti['name']='Maxpooling'
-        properti['begin_pos_origin']=self.lenth
-        properti['begin_pos']=self.lenth
-        properti['res_x']=res_x
-        properti['res_y']=res_y
-        properti['channel']=channel
-        properti['slice_num']=slice_num
-        properti['draw_h']=draw_h
-        properti['draw_l']=draw_l
-        properti['draw_w']=draw_w
-        properti['blank']=blank
-        properti['notation']=notation
+        layer=Layer('Maxpooling', self.lenth, res_x=res_x, res_y=res_y, channel=channel, slice_num=slice_num, draw_h=draw_h, draw_l=draw_l, draw_w=draw_w, blank=blank, notation=notation)
         self.lenth += (draw_w + self.module_interval) * slice_num + blank - self.module_interval
-        self.modules.append(properti)
+        self.modules.append(layer)
         self.module_num += 1
         self.use_module['Maxpooling']=True
 
@@ -216,21 +298,9 @@ class Model:
         A ReLu generator
         '''
         draw_h, draw_l, draw_w = self._Auto_Set(res_x=res_x, res_y=res_y, channel=channel, draw_h=draw_h, draw_l=draw_l, draw_w=draw_w)
-        properti={}
-        properti['name']='ReLu'
-        properti['begin_pos_origin']=self.lenth
-        properti['begin_pos']=self.lenth
-        properti['res_x']=res_x
-        properti['res_y']=res_y
-        properti['channel']=channel
-        properti['slice_num']=1 # default set to 1
-        properti['draw_h']=draw_h
-        properti['draw_l']=draw_l
-        properti['draw_w']=draw_w
-        properti['blank']=blank
-        properti['notation']=False # default set to False
+        layer=Layer('ReLu', self.lenth, res_x=res_x, res_y=res_y, channel=channel, slice_num=1, draw_h=draw_h, draw_l=draw_l, draw_w=draw_w, blank=blank, notation=False)
         self.lenth += draw_w + blank
-        self.modules.append(properti)
+        self.modules.append(layer)
         self.module_num += 1
         self.use_module['ReLu']=True
 
@@ -240,21 +310,9 @@ class Model:
         A Softmax generator
         '''
         draw_h, draw_l, draw_w = self._Auto_Set(res_x=res_x, res_y=res_y, channel=channel, draw_h=draw_h, draw_l=draw_l, draw_w=draw_w)
-        properti={}
-        properti['name']='Softmax'
-        properti['begin_pos_origin']=self.lenth
-        properti['begin_pos']=self.lenth
-        properti['res_x']=res_x
-        properti['res_y']=res_y
-        properti['channel']=channel
-        properti['slice_num']=1 # default set to 1
-        properti['draw_h']=draw_h
-        properti['draw_l']=draw_l
-        properti['draw_w']=draw_w
-        properti['blank']=blank
-        properti['notation']=notation
+        layer=Layer('Softmax', self.lenth, res_x=res_x, res_y=res_y, channel=channel, slice_num=1, draw_h=draw_h, draw_l=draw_l, draw_w=draw_w, blank=blank, notation=notation)
         self.lenth += draw_w + blank
-        self.modules.append(properti)
+        self.modules.append(layer)
         self.module_num += 1
         self.use_module['Softmax']=True
 
@@ -264,21 +322,9 @@ class Model:
         A BatchNorm generator
         '''
         draw_h, draw_l, draw_w = self._Auto_Set(res_x=res_x, res_y=res_y, channel=channel, draw_h=draw_h, draw_l=draw_l, draw_w=draw_w)
-        properti={}
-        properti['name']='BN'
-        properti['begin_pos_origin']=self.lenth
-        properti['begin_pos']=self.lenth
-        properti['res_x']=res_x
-        properti['res_y']=res_y
-        properti['channel']=channel
-        properti['slice_num']=1 # default set to 1
-        properti['draw_h']=draw_h
-        properti['draw_l']=draw_l
-        properti['draw_w']=draw_w
-        properti['blank']=blank
-        properti['notation']=False # default set to False
+        layer=Layer('BN', self.lenth, res_x=res_x, res_y=res_y, channel=channel, slice_num=1, draw_h=draw_h, draw_l=draw_l, draw_w=draw_w, blank=blank, notation=False)
         self.lenth += draw_w + blank
-        self.modules.append(properti)
+        self.modules.append(layer)
         self.module_num += 1
         self.use_module['BN']=True
 
@@ -286,101 +332,443 @@ class Model:
         '''
         A Encoder generator
         '''
-        properti={}
-        properti['name']='Encoder'
-        properti['begin_pos_origin']=self.lenth
-        properti['begin_pos']=self.lenth
-        properti['draw_h']=draw_h
-        properti['draw_l']=draw_l
-        properti['draw_w']=draw_w
-        properti['blank']=blank
-        properti['notation']=False # default set to False
+        layer=Layer('Encoder', self.lenth, draw_h=draw_h, draw_l=draw_l, draw_w=draw_w, blank=blank, notation=False)
         self.lenth += draw_w + blank
-        self.modules.append(properti)
+        self.modules.append(layer)
         self.module_num += 1
         self.use_module['Encoder']=True
 
 
+    def _graph_extent(self):
+        '''
+        Estimate the (width, height) the layers actually cover on the picture,
+        including the isometric offset of the slices, the kernels, the notation on top of them
+        and the connectors between wrapped rows. The graph is centered, so the room taken on one side is needed on the other one too.
+        '''
+        if not self.modules:
+            return 0, 0
+        self._update_lenth()
+        x0, y0, x1, y1 = self._graph_bbox(range(len(self.modules)))
+        for points in self._connector_points():
+            #the connectors of wrapped rows go round the ends of the rows (3px lines)
+            x0 = min([x0] + [x - 2 for x, y in points])
+            x1 = max([x1] + [x + 2 for x, y in points])
+        width = 2 * max(self.img_w/2 - x0, x1 - self.img_w/2)
+        height = 2 * max(self.img_h/2 - y0, y1 - self.img_h/2)
+        return width, height
+
+
+    def fit_canvas(self, margin=50, add_note=True):
+        '''
+        Resize the picture (img_w, img_h) to the extent of the layers plus margin on each side,
+        leaving room for the notes at right-bottom corner if add_note is True.
+        '''
+        width, height = self._graph_extent()
+        pad_h = margin
+        if add_note:
+            notes = sum(1 for module in self.use_module if self.use_module[module])
+            if notes:
+                width = max(width, 300)
+                pad_h = max(margin, 80 * notes + 80)
+        self.img_w = int(math.ceil(width + 2 * margin))
+        self.img_h = int(math.ceil(height + 2 * pad_h))
+
+
+    def surface_size(self, viewport=None, scale=1.0):
+        '''(width, height) in pixels of the picture drawn by Draw/render with viewport and scale'''
+        if viewport is None:
+            return int(math.ceil(self.img_w * scale)), int(math.ceil(self.img_h * scale))
+        return int(math.ceil(viewport[2] * scale)), int(math.ceil(viewport[3] * scale))
+
+
+    def _create_surface(self, output_format='png', target=None, viewport=None, scale=1.0, surface=None):
+        '''
+        create the drawing surface and context for one Draw
+        vector surfaces (svg/pdf/ps) stream to target, a filename or a writable file object
+        viewport: (x, y, w, h) of the picture to draw instead of the whole img_w*img_h, scaled by scale
+        surface: an ImageSurface of surface_size() to draw on (it is cleared) instead of a new one
+        '''
+        width, height = self.surface_size(viewport, scale)
+        if viewport is None:
+            viewport = (0, 0, self.img_w, self.img_h)
+        x, y, w, h = viewport
+        if surface is None and self.surface_pool is not None and output_format not in VECTOR_SURFACES:
+            surface = self.surface_pool.borrow(width, height)
+        if surface is not None:
+            if (surface.get_width(), surface.get_height()) != (width, height):
+                raise ValueError('surface is %dx%d, the picture is %dx%d' % (surface.get_width(), surface.get_height(), width, height))
+            self.ims = surface
+            self.cr = cairo.Context(self.ims)
+            self.cr.set_operator(cairo.OPERATOR_CLEAR)
+            self.cr.paint()
+            self.cr.set_operator(cairo.OPERATOR_OVER)
+        elif output_format in VECTOR_SURFACES:
+            surface = getattr(cairo, VECTOR_SURFACES[output_format])
+            self.ims = surface(target, width, height)
+            self.cr = cairo.Context(self.ims)
+        else:
+            self.ims = cairo.ImageSurface(cairo.FORMAT_ARGB32, width, height)
+            self.cr = cairo.Context(self.ims)
+        if self.profiler is not None:
+            self.cr = self.profiler.wrap(self.cr, self.ims)
+        if viewport != (0, 0, self.img_w, self.img_h) or scale != 1.0:
+            self.cr.scale(scale, scale)
+            self.cr.translate(-x, -y)
+        self.view = (x, y, x + w, y + h)
+
+
+    def _release_surface(self):
+        '''release the pixel buffer once the picture is written out (this also ends a vector output)'''
+        if self.surface_pool is not None and isinstance(self.ims, cairo.ImageSurface):
+            self.surface_pool.give_back(self.ims)
+        elif self.ims is not None:
+            self.ims.finish()
+        self.ims = None
+        self.cr = None
+        self.view = None
+
+
+    def _visible(self, bbox):
+        '''whether bbox (x0, y0, x1, y1) crosses the part of the picture being drawn (everything without surface)'''
+        if self.view is None:
+            return True
+        x0, y0, x1, y1 = bbox
+        return x0 < self.view[2] and self.view[0] < x1 and y0 < self.view[3] and self.view[1] < y1
+
+
+    def _detail(self, size):
+        '''whether something of size (on the picture) is bigger than lod pixels on the surface'''
+        if self.lod is None:
+            return True
+        return size * self.cr.get_matrix().xx >= self.lod
+
+
+    def set_wrap(self, aspect=None, rows=None, gap=60):
+        '''
+        Wrap the modules into several rows instead of a single line, for long networks.
+
+        aspect: The width/height ratio the graph should have, the number of rows is chosen for it
+        rows: The number of rows you want (instead of aspect)
+        gap: Free space between two rows, where the connectors from row to row are drawn
+        If both aspect and rows are None, the modules are on a single line again.
+        Use fit_canvas (or margin in Draw) to get a picture of the size of the rows.
+        '''
+        self.wrap = None if aspect is None and rows is None else {'aspect': aspect, 'rows': rows, 'gap': gap}
+
+
+    def _row_lenth(self, row):
+        '''length of a row of module indices, like self.lenth for the whole model'''
+        end = self.lenth if row[-1] + 1 == len(self.modules) else self.modules[row[-1] + 1].begin_pos_origin
+        return end - self.modules[row[0]].begin_pos_origin
+
+
+    def _module_rows(self):
+        '''
+        (rows, row_h): module indices of every row, and the height of a row
+        row_h is None when the modules are not wrapped (see set_wrap)
+        '''
+        if self.wrap is None or not self.modules:
+            return [list(range(len(self.modules)))], None
+        max_h = max(module.draw_h + module.draw_l/1.414 for module in self.modules)
+        row_h = max_h + self.font_size + 15 + abs(self.word_trans_y) + self.wrap['gap']
+        rows_num = self.wrap['rows']
+        if rows_num is None:
+            # rows_num rows of lenth/rows_num: width/height = lenth / (rows_num^2 * row_h)
+            rows_num = int(round(math.sqrt(self.lenth / (self.wrap['aspect'] * row_h))))
+        rows_num = max(1, min(rows_num, len(self.modules)))
+        target = self.lenth / rows_num
+
+        #greedy: a module goes to the next row when its middle would be beyond the target length
+        rows = [[]]
+        used = 0
+        for index in range(len(self.modules)):
+            width = self._row_lenth([index])
+            if rows[-1] and used + width/2 > target and len(rows) < rows_num:
+                rows.append([])
+                used = 0
+            rows[-1].append(index)
+            used += width
+        return rows, row_h
+
+
     def _update_lenth(self):
         '''
         change module's begin position and adjust the module to a proper position
+        (every row is centered when the modules are wrapped, see set_wrap)
         '''
         self.half_lenth = self.lenth / 2
-        for module in self.modules:
-            module['begin_pos']=module['begin_pos_origin'] - self.half_lenth + self.img_w/2
+        rows, row_h = self._module_rows()
+        self.rows = rows
+        if row_h is None:
+            for module in self.modules:
+                module.begin_pos=module.begin_pos_origin - self.half_lenth + self.img_w/2
+                module.center_y=self.img_h/2
+            return
+        for number, row in enumerate(rows):
+            start = self.modules[row[0]].begin_pos_origin
+            half_row = self._row_lenth(row) / 2
+            center_y = self.img_h/2 + (number - (len(rows)-1)/2) * row_h
+            for index in row:
+                module = self.modules[index]
+                module.begin_pos=module.begin_pos_origin - start - half_row + self.img_w/2
+                module.center_y=center_y
+
+
+    def _connector_points(self):
+        '''points of the connectors from the end of every row to the beginning of the next one (see set_wrap)'''
+        if len(self.rows) < 2:
+            return []
+        max_h = max(module.draw_h + module.draw_l/1.414 for module in self.modules)
+        connectors = []
+        for row, next_row in zip(self.rows, self.rows[1:]):
+            last, first = self.modules[row[-1]], self.modules[next_row[0]]
+            end_x = self._module_bbox(last)[2]
+            start_x = self._module_bbox(first)[0]
+            middle_y = last.center_y + max_h/2 + self.wrap['gap']/2
+            connectors.append([(end_x, last.center_y), (end_x + 20, last.center_y), (end_x + 20, middle_y),
+                               (start_x - 20, middle_y), (start_x - 20, first.center_y), (start_x, first.center_y)])
+        return connectors
+
+
+    def _Draw_Connectors(self):
+        '''connect the end of every row to the beginning of the next one (see set_wrap)'''
+        for points in self._connector_points():
+            xs, ys = [x for x, y in points], [y for x, y in points]
+            if not self._visible((min(xs) - 20, min(ys) - 20, max(xs) + 20, max(ys) + 20)):
+                continue
+            utils.draw_connector(self.cr, points, 0.4, 0.4, 0.4)
+
 
-    
     def _cal_kernel_size(self, module):
-        kernel=module['kernel']
+        kernel=module.kernel
         rate=0
-        if module['res_x']==0 or module['res_y']==0:
+        if module.res_x==0 or module.res_y==0:
             gamma=0.4
         else:
             if isinstance(kernel, int):
-                rate=kernel/max(module['res_x'],module['res_y'])
+                rate=kernel/max(module.res_x,module.res_y)
             elif isinstance(kernel, tuple):
-                rate=kernel[0]/max(module['res_x'],module['res_y'])
+                rate=kernel[0]/max(module.res_x,module.res_y)
             gamma=0.1+0.9*math.sqrt(rate)
         return gamma
 
 
-    def _Draw_Kernel(self, module):
-        if(module['name']=='Conv2d') and module['kernel'] is not None:
-            gamma=self._cal_kernel_size(module)
-            x0,y0=(module['begin_pos']+module['draw_w'], 0.5*self.img_h)
-            pt1=(x0-gamma*module['draw_l']/2.828, y0-gamma*(0.5*module['draw_h']-module['draw_l']/2.828))
-            pt2=(x0+gamma*module['draw_l']/2.828, y0-gamma*(0.5*module['draw_h']+module['draw_l']/2.828))
-            pt3=(x0+gamma*module['draw_l']/2.828, y0+gamma*(0.5*module['draw_h']-module['draw_l']/2.828))
-            pt4=(x0-gamma*module['draw_l']/2.828, y0+gamma*(0.5*module['draw_h']+module['draw_l']/2.828))
-            target=(x0+module['blank'],y0)
-            kernel=module['kernel']
-            if isinstance(kernel, int):
-                utils.draw_kernel_graph(self.cr, pt1, pt2, pt3, pt4, target, kernel, kernel)
-            elif isinstance(kernel, tuple):
-                kernel_x, kernel_y=kernel
-                utils.draw_kernel_graph(self.cr, pt1, pt2, pt3, pt4, target, kernel_x, kernel_y)
+    def _kernel_positions(self, module):
+        '''x of the right side of the slices the kernel of a module is shown on (see kernel_at in Conv2d)'''
+        if module.name!='Conv2d' or module.kernel is None:
+            return []
+        if module.kernel_at=='every':
+            slices = range(module.slice_num)
+        elif module.kernel_at=='last':
+            slices = [module.slice_num-1]
+        else:
+            slices = [0]
+        return [module.begin_pos + (module.draw_w + self.module_interval) * i + module.draw_w for i in slices]
+
+
+    def _Draw_Kernel(self, module, texts=None):
+        '''draw the kernel(s) of a module, the kernel size notes go to texts if it is given'''
+        kernel=module.kernel
+        if isinstance(kernel, int):
+            kernel_x, kernel_y=kernel, kernel
+        elif isinstance(kernel, tuple):
+            kernel_x, kernel_y=kernel
+        else:
+            return
+        gamma=self._cal_kernel_size(module)
+        for x0 in self._kernel_positions(module):
+            y0=module.center_y
+            pt1=(x0-gamma*module.draw_l/2.828, y0-gamma*(0.5*module.draw_h-module.draw_l/2.828))
+            pt2=(x0+gamma*module.draw_l/2.828, y0-gamma*(0.5*module.draw_h+module.draw_l/2.828))
+            pt3=(x0+gamma*module.draw_l/2.828, y0+gamma*(0.5*module.draw_h-module.draw_l/2.828))
+            pt4=(x0-gamma*module.draw_l/2.828, y0+gamma*(0.5*module.draw_h+module.draw_l/2.828))
+            target=(x0+module.blank,y0)
+            utils.draw_kernel_graph(self.cr, pt1, pt2, pt3, pt4, target, kernel_x, kernel_y, texts)
+
+
+    def _Draw_Kernels(self, indices=None):
+        '''
+        Draw the kernels over all the layers (or only over the modules of indices),
+        the kernel size notes are shown at once at the end
+        '''
+        texts = []
+        for index in range(len(self.modules)) if indices is None else indices:
+            module = self.modules[index]
+            bbox = self._kernel_bbox(module)
+            if bbox is not None and self._visible(bbox) and self._detail(self._cal_kernel_size(module)*module.draw_l/1.414):
+                self._Draw_Kernel(module, texts)
+        if self._detail(25):
+            self.cr.set_source_rgb(0, 0, 0)
+            text.cache.show_texts(self.cr, 'arial', 25, texts)
 
 
-    def _Draw_Graph(self):
-        '''Draw layers '''
+    def _kernel_bbox(self, module):
+        '''(x0, y0, x1, y1) covered by the kernel(s) of a module and their size notes, None without kernel'''
+        positions = self._kernel_positions(module)
+        if not positions:
+            return None
+        a = module.draw_l/2.828
+        return (min(positions) - a - 20, module.center_y - module.draw_h/2 - a - 40,
+                max(positions) + max(a, module.blank, 50), module.center_y + module.draw_h/2 + a)
+
+
+    def get_layout(self):
+        '''
+        Compute the geometry of every slice at once as numpy arrays (see layout.Layout).
+        numpy is needed.
+        '''
         self._update_lenth()
+        return layout.Layout(self)
+
+
+    def layout_data(self):
+        '''
+        The layout as plain data (dicts, lists and numbers, eg. for json.dump), computed without
+        drawing anything, cairo or numpy: the picture size and, for every module, its fields
+        (see Layer.to_dict), its bounding box, the one of its kernels (None without kernel) and
+        the faces of its slices (see utils._slice_faces, an Encoder has no slices).
+        The notations are not included, their size depends on the fonts.
+        '''
+        self._update_lenth()
+        modules = []
         for module in self.modules:
-            #draw an encoder
-            if module['name']=='Encoder':
-                center_x = module['begin_pos']
-                center_y = self.img_h / 2
-                r, g, b=self.color[module['name']]
-                utils.draw_encoder_shape(self.cr, center_x, center_y, length=module['draw_l'], height=module['draw_h'], width=module['draw_w'],
-                                        r=r, g=g, b=b)
-                continue
-            #draw other layers
-            for i in range(module['slice_num']):
-                center_x = module['begin_pos'] + (module['draw_w'] + self.module_interval) * i
-                center_y = self.img_h / 2
-                r, g, b=self.color[module['name']]
-                utils.draw_layer_slice(self.cr, center_x, center_y, length=module['draw_l'], height=module['draw_h'], width=module['draw_w'],
-                                        r=r, g=g, b=b)
-                self._Draw_Kernel(module)
+            data = module.to_dict()
+            data['bbox'] = list(self._module_bbox(module))
+            kernel_bbox = self._kernel_bbox(module)
+            data['kernel_bbox'] = None if kernel_bbox is None else list(kernel_bbox)
+            data['slices'] = []
+            if module.name!='Encoder':
+                for i in range(module.slice_num):
+                    center_x = module.begin_pos + (module.draw_w + self.module_interval) * i
+                    front, top, side = utils._slice_faces(center_x, module.center_y, module.draw_l, module.draw_h, module.draw_w)
+                    data['slices'].append({'center_x': center_x, 'center_y': module.center_y, 'front': list(front),
+                                           'top': [list(point) for point in top], 'side': [list(point) for point in side]})
+            modules.append(data)
+        return {'img_w': self.img_w, 'img_h': self.img_h, 'interval': self.module_interval, 'rows': self.rows, 'modules': modules}
+
+
+    def _Draw_Module(self, index, module, slices=None, color=None):
+        '''
+        Draw the index'th module, with its slice corners from slices (a Layout) if it is given
+        and in color (r, g, b) instead of the color of its layer if it is given
+        '''
+        r, g, b=self.color[module.name] if color is None else color
+        #draw an encoder
+        if module.name=='Encoder':
+            center_x = module.begin_pos
+            center_y = module.center_y
+            utils.draw_encoder_shape(self.cr, center_x, center_y, length=module.draw_l, height=module.draw_h, width=module.draw_w,
+                                    r=r, g=g, b=b)
+            return
+        #draw other layers, all slices of a module at once
+        if module.slice_num > 1 and not self._detail(module.draw_w + self.module_interval):
+            #the slices can't be told apart, draw them as one block
+            width = (module.draw_w + self.module_interval) * (module.slice_num-1) + module.draw_w
+            utils.draw_layer_slice(self.cr, module.begin_pos, module.center_y, length=module.draw_l, height=module.draw_h,
+                                   width=width, r=r, g=g, b=b)
+        elif self.sprite_cache is not None and isinstance(self.cr.get_target(), cairo.ImageSurface):
+            #sprites are bitmaps, vector outputs (svg/pdf/ps) keep drawing the slices
+            centers_x = [module.begin_pos + (module.draw_w + self.module_interval) * i for i in range(module.slice_num)]
+            self.sprite_cache.draw_layer_slices(self.cr, centers_x, module.center_y, length=module.draw_l, height=module.draw_h,
+                                                width=module.draw_w, r=r, g=g, b=b)
+        elif slices is not None:
+            fronts, tops, sides = slices.faces(index)
+            utils.fill_slice_faces(self.cr, fronts, tops, sides, r=r, g=g, b=b)
+        else:
+            centers_x = [module.begin_pos + (module.draw_w + self.module_interval) * i for i in range(module.slice_num)]
+            center_y = module.center_y
+            utils.draw_layer_slices(self.cr, centers_x, center_y, length=module.draw_l, height=module.draw_h, width=module.draw_w,
+                                    r=r, g=g, b=b)
+
+
+    def _get_slices(self):
+        '''precomputed slice corners if numpy is there, otherwise they are computed module by module'''
+        return self.get_layout() if layout.np.available() and self.module_interval >= 0 else None
+
+
+    def _Draw_Graph(self, slices=None):
+        '''Draw layers, with the slice corners of slices (a Layout of the current positions) if it is given'''
+        if slices is None:
+            self._update_lenth()
+            slices = self._get_slices()
+        self._Draw_Connectors()
+        for index, module in enumerate(self.modules):
+            #modules out of the picture are not even pathed
+            if self._visible(self._module_bbox(module)):
+                self._Draw_Module(index, module, slices)
+
+
+    def _module_bbox(self, module):
+        '''
+        (x0, y0, x1, y1) covered on the picture by the slices (or the encoder) of a module,
+        not including its kernel (see _kernel_bbox) and notation (see _text_notation)
+        '''
+        a = module.draw_l/2.828
+        center_y = module.center_y
+        x0 = module.begin_pos - a
+        y0 = center_y - module.draw_h/2 - a
+        y1 = center_y + module.draw_h/2 + a
+        if module.name=='Encoder':
+            x1 = module.begin_pos + module.draw_w + a
+        else:
+            x1 = module.begin_pos + (module.draw_w + self.module_interval) * (module.slice_num-1) + module.draw_w + a
+        return x0, y0, x1, y1
+
+
+    def _text_notation(self, module):
+        '''(text, pos_x, pos_y) of the parameters notation of a module'''
+        context=str(module.res_x)+'*'+str(module.res_y)+'*'+str(module.channel)
+        pos_x = module.begin_pos+module.draw_l/2.828+self.word_trans_x
+        pos_y = module.center_y-module.draw_h/2-module.draw_l/2.8-15-self.word_trans_y
+        return context, pos_x, pos_y
+
+
+    def _text_bbox(self, module):
+        '''(x0, y0, x1, y1) of the ink of the notation of a module'''
+        context, pos_x, pos_y = self._text_notation(module)
+        x_bearing, y_bearing, width, height = text.cache.extents(self.font, self.font_size, context)[:4]
+        return pos_x + x_bearing, pos_y + y_bearing, pos_x + x_bearing + width, pos_y + y_bearing + height
+
+
+    def _graph_bbox(self, indices, add_para=True):
+        '''
+        (x0, y0, x1, y1) covered by the modules of indices at their current positions (see _update_lenth),
+        with their kernels and notations (if add_para)
+        '''
+        bboxes = []
+        for index in indices:
+            module = self.modules[index]
+            bboxes.append(self._module_bbox(module))
+            if self._kernel_bbox(module) is not None:
+                bboxes.append(self._kernel_bbox(module))
+            if add_para and module.notation==True:
+                bboxes.append(self._text_bbox(module))
+        return (min(bbox[0] for bbox in bboxes), min(bbox[1] for bbox in bboxes),
+                max(bbox[2] for bbox in bboxes), max(bbox[3] for bbox in bboxes))
 
 
     def _write_text(self):
         '''add parameters notation on the graph'''
+        if not self._detail(self.font_size):
+            return
         self.cr.set_source_rgb(0, 0, 0)
-        self.cr.select_font_face(self.font, cairo.FONT_SLANT_NORMAL, cairo.FONT_WEIGHT_NORMAL)
-        self.cr.set_font_size(self.font_size)
+        texts = [self._text_notation(module) for module in self.modules
+                 if module.notation==True and self._visible(self._text_bbox(module))]
+        text.cache.show_texts(self.cr, self.font, self.font_size, texts)
 
-        for module in self.modules:
-            if module['notation']==True:
-                context=str(module['res_x'])+'*'+str(module['res_y'])+'*'+str(module['channel'])
-                pos_x = module['begin_pos']+module['draw_l']/2.828+self.word_trans_x
-                pos_y = self.img_h/2-module['draw_h']/2-module['draw_l']/2.8-15-self.word_trans_y
-                self.cr.move_to(pos_x, pos_y)
-                self.cr.show_text(context)
+
+    def _notes_bbox(self):
+        '''(x0, y0, x1, y1) of the notes at right-bottom corner, None if there is no note'''
+        names = sum(1 for module in self.use_module if self.use_module[module])
+        if not names:
+            return None
+        return self.img_w-315, self.img_h-145-80*(names-1), self.img_w, self.img_h
 
 
     def _add_notes(self):
         '''add notes at right-bottom corner'''
         level=0
+        names=[]
         for module in self.use_module:
             if self.use_module[module]:
                 #draw an encoder
@@ -393,13 +781,12 @@ class Model:
                     r, g, b=self.color[module]
                     utils.draw_layer_slice(self.cr, self.img_w-300, self.img_h-100-level, length=25, height=30, width=50,
                                                 r=r, g=g, b=b)
-                #add text
-                self.cr.set_source_rgb(0, 0, 0)
-                self.cr.select_font_face(self.font, cairo.FONT_SLANT_NORMAL, cairo.FONT_WEIGHT_NORMAL)
-                self.cr.set_font_size(40)
-                self.cr.move_to(self.img_w-200, self.img_h-100-level)
-                self.cr.show_text(module)
+                #add text (all names at once, below)
+                names.append((module, self.img_w-200, self.img_h-100-level))
                 level+=80
+        if self._detail(40):
+            self.cr.set_source_rgb(0, 0, 0)
+            text.cache.show_texts(self.cr, self.font, 40, names)
         
 
     def set_font(self, font='arial', font_size=30, trans_x=0, trans_y=0):
@@ -413,27 +800,250 @@ class Model:
     def set_color(self, layer_name, r, g, b):
         '''change layer color'''
         self.color[layer_name] = (r, g, b)    
+
+
+    def set_sprite_cache(self, sprite_cache=None):
+        '''
+        Paste the slices from sprite_cache (a cache.SpriteCache, eg. the shared cache.sprites)
+        instead of filling them one by one, which is faster for long stacks of identical slices.
+        None goes back to filling.
+        '''
+        self.sprite_cache = sprite_cache
+
+
+    def set_surface_pool(self, surface_pool=None):
+        '''
+        Draw/render PNG pictures on surfaces borrowed from surface_pool (a cache.SurfacePool, eg. the
+        shared cache.surfaces) and given back afterwards, instead of allocating new pixels every time.
+        None goes back to new surfaces.
+        '''
+        self.surface_pool = surface_pool
+
+
+    def set_disk_cache(self, disk_cache=None):
+        '''
+        Keep the pictures Draw writes to files in disk_cache (a cache.DiskCache), and when the same
+        model is drawn again with the same options, copy the kept picture to the output instead of drawing.
+        None goes back to drawing every time.
+        '''
+        self.disk_cache = disk_cache
                     
 
-    def Draw(self, output_filename='network.png', add_note=True, add_para=True):
+    def profile(self, callback=None):
+        '''
+        Measure the Draw/render calls made in a with block (see instrument.Profiler):
+            with model.profile() as profiler:
+                model.Draw('network.png')
+            print(profiler.records[-1])
+        callback is called with the record of every Draw/render as soon as it is finished.
+        '''
+        return instrument.profiling(self, callback)
+
+
+    def _stage(self, name):
+        '''time a stage of Draw when profiling'''
+        if self.profiler is None:
+            return contextlib.nullcontext()
+        return self.profiler.stage(name)
+
+
+    def _profiled(self, kind):
+        '''record a whole Draw/render when profiling'''
+        if self.profiler is None:
+            return contextlib.nullcontext()
+        return self.profiler.draw(kind)
+
+
+    def _paint(self, add_note=True, add_para=True, lod=None, slices=None):
+        '''
+        draw notes, layers and parameters on the current surface
+        lod: see Draw, slices: see _Draw_Graph
+        '''
+        self.lod = lod
+        try:
+            #add notes
+            notes = self._notes_bbox()
+            if add_note and notes is not None and self._visible(notes):
+                with self._stage('add_notes'):
+                    self._add_notes()
+
+            #add graph
+            with self._stage('Draw_Graph'):
+                self._Draw_Graph(slices)
+
+            #add kernels, over all layers
+            with self._stage('Draw_Kernel'):
+                self._Draw_Kernels()
+
+            #add parameters
+            if add_para:
+                with self._stage('write_text'):
+                    self._write_text()
+        finally:
+            self.lod = None
+
+
+    def Draw(self, output_filename='network.png', add_note=True, add_para=True, margin=None, output_format=None, tile_size=None,
+             viewport=None, scale=1.0, lod=None):
         '''
         Draw your graph after all layers have already set
         [This is necessary]
+
+        output_filename: A filename or any writable binary file object
+        margin: If it's set, the picture is resized to the extent of the layers
+        plus margin pixels on each side instead of using img_w/img_h (see fit_canvas)
+        output_format: 'png', 'svg', 'pdf' or 'ps'. By default it is png, or svg/pdf/ps if
+        output_filename has that extension. svg/pdf/ps are drawn as vectors straight
+        to the output, without any pixel buffer
+        tile_size: If it's set, a png is drawn tile by tile (tile_size*tile_size pixels) and written
+        a row of tiles at a time, for pictures too big for memory or for cairo (see tiles.write_png)
+        viewport: (x, y, w, h), draw only this rectangle of the picture (a w*h picture), anything
+        outside of it is skipped (see zoom)
+        scale: the picture (or the viewport) is drawn scale times bigger
+        lod: If it's set (in pixels, eg. 2), details smaller than lod pixels are simplified, for small
+        pictures: the slices of a module closer than lod are drawn as one block, the kernels and the
+        texts smaller than lod are not drawn (see thumbnails)
         '''
-        #add notes
-        if add_note:
-            self._add_notes()
+        output_format = _output_format(output_filename, output_format)
+        if margin is not None:
+            self.fit_canvas(margin, add_note)
+
+        with self._profiled('Draw'):
+            #pictures written to files may be already drawn (see set_disk_cache)
+            key = None
+            if self.disk_cache is not None and isinstance(output_filename, (str, os.PathLike)):
+                with self._stage('disk_cache'):
+                    key = self.disk_cache.key(self, output_format, add_note=add_note, add_para=add_para,
+                                              viewport=viewport, scale=scale, lod=lod)
+                    if self.disk_cache.get(key, output_format, output_filename):
+                        return
 
-        #add graph
-        self._Draw_Graph()
+            self._draw(output_filename, add_note, add_para, output_format, tile_size, viewport, scale, lod)
 
-        #add parameters
-        if add_para:
-            self._write_text()
+            if key is not None:
+                with self._stage('disk_cache'):
+                    self.disk_cache.put(key, output_format, output_filename)
 
-        #write out
-        self.ims.write_to_png(output_filename)
 
+    def _draw(self, output_filename, add_note, add_para, output_format, tile_size, viewport, scale, lod):
+        '''draw and write the picture for Draw'''
+        whole = viewport is None and scale == 1.0 and lod is None
+        if tile_size is not None and output_format == 'png' and whole:
+            with self._stage('tiles'):
+                tiles.write_png(self, output_filename, tile_size, tile_size, add_note, add_para)
+            return
 
+        if self.raster is not None and output_format == 'png' and whole:
+            with self._stage('raster'):
+                canvas = self.raster.draw(self, add_note, add_para)
+            with self._stage('write_to_png'):
+                canvas.write_to_png(output_filename)
+            return
 
+        self._create_surface(output_format, output_filename, viewport, scale)
+        try:
+            self._paint(add_note, add_para, lod)
+
+            #write out
+            with self._stage('write_to_png' if output_format == 'png' else 'write_' + output_format):
+                if output_format == 'png':
+                    self.ims.write_to_png(output_filename)
+                else:
+                    self.ims.finish()
+        finally:
+            self._release_surface()
 
+
+    def render(self, add_note=True, add_para=True, margin=None, as_array=False, viewport=None, scale=1.0, surface=None, lod=None):
+        '''
+        Draw your graph in memory instead of writing a file (see Draw for the parameters)
+
+        Returns the content of the PNG file as bytes, or if as_array is True, a numpy array
+        (img_h, img_w, 4) viewing the pixels of the picture without copy (see utils.surface_to_array)
+        surface: An ImageSurface of surface_size() to draw on instead of a new one, eg. to reuse
+        the same pixels for many pictures (see renderer.Renderer). It is cleared first
+        '''
+        if margin is not None:
+            self.fit_canvas(margin, add_note)
+
+        with self._profiled('render'):
+            if self.raster is not None and viewport is None and scale == 1.0 and surface is None and lod is None:
+                with self._stage('raster'):
+                    canvas = self.raster.draw(self, add_note, add_para)
+                if as_array:
+                    #the picture is changed by the next Draw/render
+                    return utils.surface_to_array(canvas)
+                with self._stage('write_to_png'):
+                    buffer = io.BytesIO()
+                    canvas.write_to_png(buffer)
+                return buffer.getvalue()
+
+            self._create_surface(viewport=viewport, scale=scale, surface=surface)
+            try:
+                self._paint(add_note, add_para, lod)
+                if as_array:
+                    return utils.surface_to_array(self.ims)
+                with self._stage('write_to_png'):
+                    buffer = io.BytesIO()
+                    self.ims.write_to_png(buffer)
+                return buffer.getvalue()
+            finally:
+                if as_array or surface is not None:
+                    #the array or the caller still uses the pixels, just let go of the surface
+                    self.ims = None
+                    self.cr = None
+                    self.view = None
+                else:
+                    self._release_surface()
+
+
+    def thumbnails(self, widths, add_note=False, add_para=True, lod=2):
+        '''
+        Draw small pictures of several widths (in pixels) at once, the layout is computed only once.
+        Details smaller than lod pixels are simplified (see Draw).
+        Returns the PNG file (bytes) of every width, in order.
+        '''
+        pictures = []
+        with self._profiled('thumbnails'):
+            self._update_lenth()
+            slices = self._get_slices()
+            for width in widths:
+                self._create_surface(scale=width / self.img_w)
+                try:
+                    self._paint(add_note, add_para, lod, slices)
+                    with self._stage('write_to_png'):
+                        buffer = io.BytesIO()
+                        self.ims.write_to_png(buffer)
+                    pictures.append(buffer.getvalue())
+                finally:
+                    self._release_surface()
+        return pictures
+
+
+    def zoom_viewport(self, first, last=None, margin=20, add_para=True):
+        '''
+        (x, y, w, h) of the picture around the modules first..last (indices, both included, negative
+        ones count from the end like model[i]), with their kernels and notations (if add_para), plus margin on each side
+        '''
+        self._update_lenth()
+        last = first if last is None else last
+        indices = range(len(self.modules))[first:last+1 or None]
+        if not indices:
+            raise IndexError('no module between %s and %s' % (first, last))
+        x0, y0, x1, y1 = self._graph_bbox(indices, add_para)
+        return x0 - margin, y0 - margin, x1 - x0 + 2*margin, y1 - y0 + 2*margin
+
+
+    def zoom(self, first, last=None, output_filename=None, width=None, margin=20, add_para=True, output_format=None):
+        '''
+        Draw a preview of the modules first..last only (indices, both included, see zoom_viewport),
+        the other modules are skipped. The notes are not drawn.
+
+        width: If it's set, the preview is scaled to this width in pixels
+        output_filename: As in Draw, if it is None the PNG file is returned as bytes (see render)
+        '''
+        viewport = self.zoom_viewport(first, last, margin, add_para)
+        scale = 1.0 if width is None else width / viewport[2]
+        if output_filename is None:
+            return self.render(add_note=False, add_para=add_para, viewport=viewport, scale=scale)
+        self.Draw(output_filename, add_note=False, add_para=add_para, output_format=output_format, viewport=viewport, scale=scale)
@@ -0,0 +1,150 @@
+# Software License Agreement (MIT License)
+#
+# Copyright (C) 2019 Chuanyu Pan (pancy17@mails.tsinghua.edu.cn)
+# All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and 
+#associated documentation files (the "Software"), to deal in the Software without restriction, 
+#including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+#and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, 
+#subject to the following conditions:
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in the
+#   documentation and/or other materials provided with the distribution.
+# * Neither the name of the Tsinghua University nor the
+#   names of its contributors may be used to endorse or promote products
+#   derived from this software without specific prior written permission.
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES 
+#OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE 
+#LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR 
+#IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+'''spec (build a slices Model from plain data, eg. loaded from JSON)'''
+
+import re
+import json
+from NetPainter.slices import Model
+
+'''
+A model spec is a dict like
+    {
+        "img_w": 1000, "img_h": 1000, "interval": 10,
+        "layers": [{"type": "Conv2d", "res_x": 256, "res_y": 256, "channel": 3, "has_ReLu": true},
+                   {"type": "Maxpooling", "res_x": 128, "res_y": 128, "channel": 3}],
+        "font": {"font": "arial", "font_size": 30},
+        "color": {"Conv2d": [0.9, 0.5, 0.8]},
+        "output": "network.png",
+        "draw": {"add_note": true, "add_para": true}
+    }
+Every layer is a call of the module function "type" with the other keys as arguments,
+"font" is passed to set_font, "color" to set_color and "draw" to Draw.
+Only "layers" is needed.
+'''
+LAYER_TYPES = ('Conv2d', 'Residual', 'Maxpooling', 'ReLu', 'Softmax', 'BN', 'Encoder', 'customize')
+DRAW_KEYS = ('add_note', 'add_para', 'margin', 'output_format')
+
+'''the beginning of a spec at the beginning of a line, where the reading goes on after a broken one'''
+SPEC_START = re.compile(r'\n[{\[]')
+
+
+class InvalidSpec(ValueError):
+    '''A spec which could not be read, given by iter_specs in its place (build_model raises it)'''
+
+
+def build_model(spec):
+    '''Build a Model from a spec, see above'''
+    if isinstance(spec, InvalidSpec):
+        raise spec
+    if not isinstance(spec, dict) or not isinstance(spec.get('layers'), list):
+        raise ValueError('a model spec must be a dict with a "layers" list')
+    model = Model(img_w=spec.get('img_w', 1000), img_h=spec.get('img_h', 1000), interval=spec.get('interval', 10))
+    for layer in spec['layers']:
+        layer = dict(layer)
+        layer_type = layer.pop('type', None)
+        if layer_type not in LAYER_TYPES:
+            raise ValueError('unknown layer type: %s' % layer_type)
+        if isinstance(layer.get('kernel'), list): # JSON has no tuple
+            layer['kernel'] = tuple(layer['kernel'])
+        try:
+            getattr(model, layer_type)(**layer)
+        except TypeError as e: # unknown or missing arguments
+            raise ValueError('bad %s layer: %s' % (layer_type, e))
+    if 'font' in spec:
+        try:
+            model.set_font(**spec['font'])
+        except TypeError as e:
+            raise ValueError('bad font: %s' % e)
+    for layer_name, (r, g, b) in spec.get('color', {}).items():
+        model.set_color(layer_name, r, g, b)
+    return model
+
+
+def draw_options(spec):
+    '''keyword arguments of Draw given by a spec'''
+    options = dict(spec.get('draw', {}))
+    for key in options:
+        if key not in DRAW_KEYS:
+            raise ValueError('unknown Draw option: %s' % key)
+    return options
+
+
+def iter_specs(fp, chunk_size=65536):
+    '''
+    Read specs one by one from a text file object, without loading the whole file.
+    The file can hold JSON lines (or any JSON values one after another, each one beginning a line),
+    or a single JSON list of specs.
+    Outside of a list, a spec which is not valid JSON gives one InvalidSpec in its place, even if it
+    takes several lines, and the reading goes on with the next line beginning with { or [.
+    '''
+    decoder = json.JSONDecoder()
+    buffer = ''
+    pos = 0
+    eof = False
+    in_list = None # the file is a list of specs
+    while True:
+        #skip blanks and separators between specs
+        while True:
+            while pos < len(buffer) and (buffer[pos].isspace() or (in_list and buffer[pos] == ',')):
+                pos += 1
+            if pos < len(buffer) or eof:
+                break
+            buffer, pos = fp.read(chunk_size), 0
+            eof = not buffer
+        if pos == len(buffer):
+            if in_list:
+                raise ValueError('unfinished list of specs')
+            return
+        if in_list is None:
+            in_list = buffer[pos] == '['
+            if in_list:
+                pos += 1
+                continue
+        if in_list and buffer[pos] == ']':
+            in_list = False
+            pos += 1
+            continue
+        try:
+            spec, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError as e:
+            if not in_list and (buffer.find('\n', e.pos) >= 0 or eof):
+                #the error is not just the end of the buffer: skip the broken spec
+                start = SPEC_START.search(buffer, pos)
+                if start is not None or eof:
+                    pos = len(buffer) if start is None else start.start() + 1
+                    yield InvalidSpec('invalid JSON: %s' % e.msg)
+                    continue
+            elif eof:
+                raise
+            #the spec goes on in the next chunk
+            chunk = fp.read(chunk_size)
+            eof = not chunk
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+        pos = end
+        yield spec
+
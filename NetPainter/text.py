@@ -0,0 +1,125 @@
+# Software License Agreement (MIT License)
+#
+# Copyright (C) 2019 Chuanyu Pan (pancy17@mails.tsinghua.edu.cn)
+# All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and 
+#associated documentation files (the "Software"), to deal in the Software without restriction, 
+#including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+#and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, 
+#subject to the following conditions:
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in the
+#   documentation and/or other materials provided with the distribution.
+# * Neither the name of the Tsinghua University nor the
+#   names of its contributors may be used to endorse or promote products
+#   derived from this software without specific prior written permission.
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES 
+#OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE 
+#LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR 
+#IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+'''text (fonts and glyphs resolved once, text drawn in batches)'''
+
+import threading
+import collections
+from NetPainter.lazy import cairo
+
+
+class TextCache:
+    def __init__(self, max_runs=4096, max_fonts=64):
+        '''
+        Keeps a cairo ScaledFont for every (font, size, transformation) and the glyphs and extents
+        of every text already shaped with it, so that the same notations (eg. '128*128*128') or kernel sizes
+        are only shaped once, and all the texts of a font are shown with a single show_glyphs.
+        At most max_fonts ScaledFonts (every drawing scale needs its own), max_runs shaped texts and
+        max_runs extents are kept, the least recently used ones are dropped.
+        It can be shared by drawings running in several threads.
+        '''
+        self.max_runs = max_runs
+        self.max_fonts = max_fonts
+        self._fonts = collections.OrderedDict()
+        self._runs = collections.OrderedDict()
+        self._extents = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+
+    def clear(self):
+        with self._lock:
+            self._fonts.clear()
+            self._runs.clear()
+            self._extents.clear()
+
+
+    def scaled_font(self, font, size, matrix=None):
+        '''ScaledFont of a font face name and size, for the transformation matrix of a context (only scale/rotation matter)'''
+        ctm = (1, 0, 0, 1) if matrix is None else (matrix.xx, matrix.yx, matrix.xy, matrix.yy)
+        key = (font, size, ctm)
+        with self._lock:
+            scaled_font = self._fonts.get(key)
+            if scaled_font is None:
+                face = cairo.ToyFontFace(font, cairo.FONT_SLANT_NORMAL, cairo.FONT_WEIGHT_NORMAL)
+                scaled_font = cairo.ScaledFont(face, cairo.Matrix(xx=size, yy=size), cairo.Matrix(*ctm), cairo.FontOptions())
+                self._fonts[key] = scaled_font
+                if len(self._fonts) > self.max_fonts:
+                    self._fonts.popitem(last=False)
+            else:
+                self._fonts.move_to_end(key)
+            return scaled_font
+
+
+    def glyphs(self, scaled_font, key, text):
+        '''glyphs (index, x, y) of text shown at (0, 0)'''
+        run_key = (key, text)
+        with self._lock:
+            run = self._runs.get(run_key)
+            if run is None:
+                run = [(glyph[0], glyph[1], glyph[2]) for glyph in scaled_font.text_to_glyphs(0, 0, text, False)]
+                self._runs[run_key] = run
+                if len(self._runs) > self.max_runs:
+                    self._runs.popitem(last=False)
+            else:
+                self._runs.move_to_end(run_key)
+            return run
+
+
+    def extents(self, font, size, text):
+        '''(x_bearing, y_bearing, width, height, x_advance, y_advance) of text, in user space'''
+        key = (font, size, text)
+        with self._lock:
+            extents = self._extents.get(key)
+            if extents is not None:
+                self._extents.move_to_end(key)
+                return extents
+        extents = tuple(self.scaled_font(font, size).text_extents(text))
+        with self._lock:
+            self._extents[key] = extents
+            if len(self._extents) > self.max_runs:
+                self._extents.popitem(last=False)
+        return extents
+
+
+    def show_texts(self, cr, font, size, texts):
+        '''
+        Show all texts, a list of (text, x, y), with one show_glyphs
+        (x, y) is the start of the base line, like move_to + show_text
+        '''
+        if not texts:
+            return
+        matrix = cr.get_matrix()
+        scaled_font = self.scaled_font(font, size, matrix)
+        key = (font, size, (matrix.xx, matrix.yx, matrix.xy, matrix.yy))
+        glyphs = []
+        for text, x, y in texts:
+            glyphs.extend(cairo.Glyph(index, x + glyph_x, y + glyph_y) for index, glyph_x, glyph_y in self.glyphs(scaled_font, key, text))
+        cr.set_scaled_font(scaled_font)
+        cr.show_glyphs(glyphs)
+
+
+'''shared by all the drawings and threads (see renderer.Renderer), bounded as any TextCache'''
+cache = TextCache()
@@ -0,0 +1,223 @@
+# Software License Agreement (MIT License)
+#
+# Copyright (C) 2019 Chuanyu Pan (pancy17@mails.tsinghua.edu.cn)
+# All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and 
+#associated documentation files (the "Software"), to deal in the Software without restriction, 
+#including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+#and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, 
+#subject to the following conditions:
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in the
+#   documentation and/or other materials provided with the distribution.
+# * Neither the name of the Tsinghua University nor the
+#   names of its contributors may be used to endorse or promote products
+#   derived from this software without specific prior written permission.
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES 
+#OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE 
+#LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR 
+#IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+'''tiles (draw a Model tile by tile, for pictures too big for one surface)'''
+
+import os
+import sys
+import math
+import zlib
+import json
+import struct
+from NetPainter.lazy import cairo
+import NetPainter.utils as utils
+import NetPainter.text as text
+
+
+class SpatialIndex:
+    def __init__(self, bboxes, cell_size=1024):
+        '''
+        Uniform grid over bounding boxes (x0, y0, x1, y1), to find the ones crossing a rectangle
+        without looking at all of them.
+        '''
+        self.cell_size = cell_size
+        self.bboxes = list(bboxes)
+        self.cells = {}
+        for index, bbox in enumerate(self.bboxes):
+            for cell in self._cells(bbox):
+                self.cells.setdefault(cell, []).append(index)
+
+
+    def _cells(self, bbox):
+        x0, y0, x1, y1 = [int(math.floor(value / self.cell_size)) for value in bbox]
+        for cell_x in range(x0, x1 + 1):
+            for cell_y in range(y0, y1 + 1):
+                yield cell_x, cell_y
+
+
+    def query(self, bbox):
+        '''indices (sorted) of the bounding boxes crossing bbox'''
+        x0, y0, x1, y1 = bbox
+        found = set()
+        for cell in self._cells(bbox):
+            for index in self.cells.get(cell, ()):
+                bx0, by0, bx1, by1 = self.bboxes[index]
+                if bx0 < x1 and x0 < bx1 and by0 < y1 and y0 < by1:
+                    found.add(index)
+        return sorted(found)
+
+
+def _text_bboxes(model):
+    '''{module index: (text, pos_x, pos_y, bbox)} of the notations'''
+    texts = {}
+    for index, module in enumerate(model.modules):
+        if module.notation==True:
+            context, pos_x, pos_y = model._text_notation(module)
+            texts[index] = (context, pos_x, pos_y, model._text_bbox(module))
+    return texts
+
+
+def iter_tiles(model, tile_w=1024, tile_h=1024, add_note=True, add_para=True, scale=1.0):
+    '''
+    Draw the picture of model (img_w*scale, img_h*scale) tile by tile, row by row,
+    and yield (x, y, surface) for every tile. A tile only draws the modules and notations crossing it.
+    The surfaces are reused for the next tiles, the tiles at the right and bottom edges are smaller.
+    '''
+    model._update_lenth()
+    slices = model._get_slices()
+    width = int(math.ceil(model.img_w * scale))
+    height = int(math.ceil(model.img_h * scale))
+    surfaces = {}
+    saved_cr = model.cr
+    try:
+        texts = _text_bboxes(model) if add_para else {}
+        modules = SpatialIndex([model._module_bbox(module) for module in model.modules], cell_size=tile_w / scale)
+        kernel_indices = [index for index, module in enumerate(model.modules) if model._kernel_bbox(module) is not None]
+        kernels = SpatialIndex([model._kernel_bbox(model.modules[index]) for index in kernel_indices], cell_size=tile_w / scale)
+        notations = SpatialIndex([texts[index][3] for index in sorted(texts)], cell_size=tile_w / scale)
+        notation_indices = sorted(texts)
+        notes_bbox = model._notes_bbox()
+
+        for y in range(0, height, tile_h):
+            for x in range(0, width, tile_w):
+                size = (min(tile_w, width - x), min(tile_h, height - y))
+                if size not in surfaces:
+                    surfaces[size] = cairo.ImageSurface(cairo.FORMAT_ARGB32, size[0], size[1])
+                surface = surfaces[size]
+                model.cr = cr = cairo.Context(surface)
+                cr.set_operator(cairo.OPERATOR_CLEAR)
+                cr.paint()
+                cr.set_operator(cairo.OPERATOR_OVER)
+                cr.translate(-x, -y)
+                cr.scale(scale, scale)
+                bbox = (x / scale, y / scale, (x + size[0]) / scale, (y + size[1]) / scale)
+
+                #same order as Model._paint
+                if add_note and notes_bbox is not None and notes_bbox[0] < bbox[2] and bbox[0] < notes_bbox[2] \
+                        and notes_bbox[1] < bbox[3] and bbox[1] < notes_bbox[3]:
+                    model._add_notes()
+                model._Draw_Connectors()
+                for index in modules.query(bbox):
+                    model._Draw_Module(index, model.modules[index], slices)
+                model._Draw_Kernels([kernel_indices[hit] for hit in kernels.query(bbox)])
+                cr.set_source_rgb(0, 0, 0)
+                text.cache.show_texts(cr, model.font, model.font_size,
+                                      [texts[notation_indices[hit]][:3] for hit in notations.query(bbox)])
+                surface.flush()
+                yield x, y, surface
+    finally:
+        model.cr = saved_cr
+
+
+def write_tiles(model, directory, tile_size=1024, levels=1, add_note=True, add_para=True):
+    '''
+    Write the picture as a pyramid of PNG tiles: directory/<level>/<row>_<col>.png,
+    level 0 is the full size, every next level is half the size of the previous one.
+    directory/tiles.json describes the pyramid. Returns the number of tiles.
+    '''
+    count = 0
+    info = {'width': model.img_w, 'height': model.img_h, 'tile_size': tile_size, 'levels': []}
+    for level in range(levels):
+        scale = 0.5 ** level
+        os.makedirs(os.path.join(directory, str(level)), exist_ok=True)
+        for x, y, surface in iter_tiles(model, tile_size, tile_size, add_note, add_para, scale):
+            surface.write_to_png(os.path.join(directory, str(level), '%d_%d.png' % (y // tile_size, x // tile_size)))
+            count += 1
+        info['levels'].append({'scale': scale, 'width': int(math.ceil(model.img_w * scale)),
+                               'height': int(math.ceil(model.img_h * scale))})
+    with open(os.path.join(directory, 'tiles.json'), 'w') as fp:
+        json.dump(info, fp, indent=1)
+    return count
+
+
+class PNGWriter:
+    def __init__(self, fp, width, height):
+        '''
+        Write an 8 bit RGBA PNG to the binary file object fp, a few rows at a time (see write_rows),
+        so the whole picture is never in memory.
+        '''
+        self.fp = fp
+        self.compressor = zlib.compressobj(6)
+        fp.write(b'\x89PNG\r\n\x1a\n')
+        self._chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0))
+
+
+    def _chunk(self, kind, data):
+        self.fp.write(struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff))
+
+
+    def write_rows(self, rows):
+        '''rows: uint8 numpy array (n, width, 4) of RGBA pixels'''
+        filtered = bytearray()
+        for row in rows:
+            filtered += b'\x00' + row.tobytes()
+        data = self.compressor.compress(bytes(filtered))
+        if data:
+            self._chunk(b'IDAT', data)
+
+
+    def close(self):
+        self._chunk(b'IDAT', self.compressor.flush())
+        self._chunk(b'IEND', b'')
+
+
+def to_rgba(pixels):
+    '''straight RGBA copy of the premultiplied native-endian ARGB32 pixels of cairo (see utils.surface_to_array)'''
+    np = utils.np
+    if sys.byteorder == 'little':
+        b, g, r, a = [pixels[..., i].astype(np.uint16) for i in range(4)]
+    else:
+        a, r, g, b = [pixels[..., i].astype(np.uint16) for i in range(4)]
+    safe = np.maximum(a, 1)
+    rgba = np.stack([(r * 255 + safe // 2) // safe, (g * 255 + safe // 2) // safe, (b * 255 + safe // 2) // safe, a], axis=-1)
+    return np.where(a[..., None] > 0, rgba, 0).astype(np.uint8)
+
+
+def write_png(model, output_filename, tile_w=1024, tile_h=256, add_note=True, add_para=True):
+    '''
+    Draw the picture tile by tile into one PNG file (a filename or a binary file object), one row of tiles
+    at a time: only a row of tile_h pixels is ever in memory, and the picture can be bigger than the
+    32767 pixels a cairo surface can hold. numpy is needed.
+    '''
+    np = utils.np
+    if not np.available():
+        raise ImportError('numpy is required to write a tiled PNG')
+    fp = open(output_filename, 'wb') if isinstance(output_filename, (str, bytes, os.PathLike)) else output_filename
+    try:
+        writer = PNGWriter(fp, model.img_w, model.img_h)
+        strip = None
+        for x, y, surface in iter_tiles(model, tile_w, tile_h, add_note, add_para):
+            if x == 0:
+                if strip is not None:
+                    writer.write_rows(strip)
+                strip = np.zeros((surface.get_height(), model.img_w, 4), dtype=np.uint8)
+            strip[:, x:x + surface.get_width()] = to_rgba(utils.surface_to_array(surface))
+        if strip is not None:
+            writer.write_rows(strip)
+        writer.close()
+    finally:
+        if fp is not output_filename:
+            fp.close()
@@ -26,8 +26,10 @@
 
 '''utils (important tools)'''
 
-import cairo
 import math
+import NetPainter.text as text
+
+from NetPainter.lazy import numpy as np # optional, only surface_to_array needs it
 
 def draw_rectangle(cr, bottom_x, bottom_y, length, width, r=0, g=0, b=0):
     '''
@@ -66,34 +68,101 @@ def draw_parallelogram(cr, pt1, pt2, pt3, pt4, r=0, g=0, b=0):
     cr.fill()
 
 
-def draw_layer_slice(cr, center_x, center_y, length, height, width, r=0, g=0, b=0):
+def _slice_faces(center_x, center_y, length, height, width):
     '''
-    (center_x,center_y) is the left-side face center position of the layer on 2D surface
-    length is on y=x dir 
-    height is on y dir
-    width is on x dir
+    Corner points of the three visible faces of a slice, as (front, top, side).
+    front is a rectangle (x, y, width, height), top and side are four points (x,y)
     '''
-    #set coordinates
     top_y=center_y-height/2-length/2.828
     middle_y=center_y-height/2+length/2.828
     bottom_y=center_y+height/2+length/2.828
     left_x=center_x-length/2.828+width
     right_x=center_x+length/2.828+width
+    front=(left_x-width, middle_y, width, height)
+    top=((left_x-width, middle_y), (right_x-width, top_y), (right_x, top_y), (left_x, middle_y))
+    side=((left_x, bottom_y), (left_x, middle_y), (right_x, top_y), (right_x, center_y+height/2-length/2.828))
+    return front, top, side
+
+
+def draw_layer_slice(cr, center_x, center_y, length, height, width, r=0, g=0, b=0):
+    '''
+    (center_x,center_y) is the left-side face center position of the layer on 2D surface
+    length is on y=x dir 
+    height is on y dir
+    width is on x dir
+    '''
+    front, top, side = _slice_faces(center_x, center_y, length, height, width)
 
     #draw front
-    draw_rectangle(cr, left_x-width, middle_y, width, height, r*0.8, g*0.8, b*0.8)
+    draw_rectangle(cr, front[0], front[1], front[2], front[3], r*0.8, g*0.8, b*0.8)
 
     #draw top
-    draw_parallelogram(cr, (left_x-width, middle_y), (right_x-width, top_y), (right_x, top_y), (left_x, middle_y), r*1.2, g*1.2, b*1.2)
+    draw_parallelogram(cr, top[0], top[1], top[2], top[3], r*1.2, g*1.2, b*1.2)
 
     #draw side
-    draw_parallelogram(cr, (left_x, bottom_y), (left_x, middle_y), (right_x, top_y), (right_x, center_y+height/2-length/2.828), r, g, b)
+    draw_parallelogram(cr, side[0], side[1], side[2], side[3], r, g, b)
+
+
+def _add_quad(cr, quad):
+    '''add a closed quadrangle to the current path without filling it'''
+    cr.move_to(quad[0][0], quad[0][1])
+    cr.line_to(quad[1][0], quad[1][1])
+    cr.line_to(quad[2][0], quad[2][1])
+    cr.line_to(quad[3][0], quad[3][1])
+    cr.close_path()
 
 
-def draw_kernel_graph(cr, pt1, pt2, pt3, pt4, target, kernel_size_x, kernel_size_y):
+def fill_slice_faces(cr, fronts, tops, sides, r=0, g=0, b=0):
+    '''
+    Fill the faces of a run of identical slices with one fill() per face color.
+    fronts/tops/sides are sequences of faces as returned by _slice_faces, from left to right.
+
+    Painting all sides first keeps the painter's order: a side face is only covered by the
+    front and top faces of the slices on its right, while fronts and tops never overlap
+    each other across slices (as long as the slices do not overlap on x, see draw_layer_slices).
+    '''
+    cr.set_source_rgb(r, g, b)
+    for side in sides:
+        _add_quad(cr, side)
+    cr.fill()
+    cr.set_source_rgb(r*0.8, g*0.8, b*0.8)
+    for front in fronts:
+        cr.rectangle(front[0], front[1], front[2], front[3])
+    cr.fill()
+    cr.set_source_rgb(r*1.2, g*1.2, b*1.2)
+    for top in tops:
+        _add_quad(cr, top)
+    cr.fill()
+
+
+def draw_layer_slices(cr, centers_x, center_y, length, height, width, r=0, g=0, b=0):
+    '''
+    Draw a run of identical slices (eg. the slices of one module) in three fills instead of
+    three fills per slice. centers_x are the center_x of the slices from left to right, 
+    see draw_layer_slice for the other parameters.
+    '''
+    centers_x=list(centers_x)
+    for i in range(1, len(centers_x)):
+        if centers_x[i]-centers_x[i-1] < width:
+            #overlapping front faces, only the one-by-one painting is correct
+            for center_x in centers_x:
+                draw_layer_slice(cr, center_x, center_y, length, height, width, r, g, b)
+            return
+    fronts, tops, sides = [], [], []
+    for center_x in centers_x:
+        front, top, side = _slice_faces(center_x, center_y, length, height, width)
+        fronts.append(front)
+        tops.append(top)
+        sides.append(side)
+    fill_slice_faces(cr, fronts, tops, sides, r, g, b)
+
+
+def draw_kernel_graph(cr, pt1, pt2, pt3, pt4, target, kernel_size_x, kernel_size_y, texts=None):
     '''
     pt1/pt2/pt3/pt4 are four corner points of the kernel square on a layer, as a tuple (x,y)
     target is the point where the kernel converge, also as a tuple (x,y)
+    texts: If it is a list, the kernel size notes are added to it as (text, x, y) to be shown
+    later with others (arial, 25) instead of being shown here
     '''
     cr.set_source_rgba(0, 0, 0, 1)
     cr.set_line_width(2)
@@ -126,19 +195,39 @@ def draw_kernel_graph(cr, pt1, pt2, pt3, pt4, target, kernel_size_x, kernel_size
     cr.line_to(x0, y0)
     cr.stroke()
     #add kernel size notes
-    cr.set_source_rgb(0, 0, 0)
-    cr.select_font_face('arial', cairo.FONT_SLANT_NORMAL, cairo.FONT_WEIGHT_NORMAL)
-    cr.set_font_size(25)
     tex_x1=(x1+x2)/2
     tex_y1=(y1+y2)/2-15
     tex_x2=(x4+x1)/2-20
     tex_y2=(y4+y1)/2
     kernel_size_x=str(kernel_size_x)
     kernel_size_y=str(kernel_size_y)
-    cr.move_to(tex_x1, tex_y1)
-    cr.show_text(kernel_size_x)
-    cr.move_to(tex_x2,tex_y2)
-    cr.show_text(kernel_size_y)
+    notes=[(kernel_size_x, tex_x1, tex_y1), (kernel_size_y, tex_x2, tex_y2)]
+    if texts is not None:
+        texts.extend(notes)
+        return
+    cr.set_source_rgb(0, 0, 0)
+    text.cache.show_texts(cr, 'arial', 25, notes)
+
+def draw_connector(cr, points, r=0, g=0, b=0, line_width=3):
+    '''
+    A polyline through points (a list of (x,y)) with an arrow head at the last point
+    '''
+    cr.set_source_rgb(r, g, b)
+    cr.set_line_width(line_width)
+    cr.set_dash([])
+    cr.move_to(points[0][0], points[0][1])
+    for x, y in points[1:]:
+        cr.line_to(x, y)
+    cr.stroke()
+    #arrow head along the last segment
+    (x0, y0), (x1, y1) = points[-2], points[-1]
+    angle = math.atan2(y1-y0, x1-x0)
+    size = 4*line_width
+    cr.move_to(x1, y1)
+    cr.line_to(x1-size*math.cos(angle-0.5), y1-size*math.sin(angle-0.5))
+    cr.line_to(x1-size*math.cos(angle+0.5), y1-size*math.sin(angle+0.5))
+    cr.close_path()
+    cr.fill()
 
 def draw_encoder_shape(cr, center_x, center_y, length, height, width, r=0, g=0, b=0):
     '''
@@ -168,6 +257,15 @@ def draw_encoder_shape(cr, center_x, center_y, length, height, width, r=0, g=0,
     draw_triangle(cr, r_pt1, r_pt4, c_pt, r*0.8, g*0.8, b*0.8)
     draw_parallelogram(cr, r_pt1, r_pt2, r_pt3, r_pt4, r, g, b)
 
-    
-
 
+def surface_to_array(surface):
+    '''
+    A numpy view (height, width, 4) over the pixels of an ARGB32 ImageSurface, without copy.
+    The channels are in cairo's order: premultiplied B, G, R, A on little-endian machines.
+    The view keeps the surface alive, don't finish() the surface while using it.
+    '''
+    if not np.available():
+        raise ImportError('numpy is required to get the pixels as an array')
+    surface.flush()
+    height, width, stride = surface.get_height(), surface.get_width(), surface.get_stride()
+    return np.ndarray(shape=(height, width, 4), dtype=np.uint8, buffer=surface.get_data(), strides=(stride, 4, 1))
@@ -0,0 +1,184 @@
+# Software License Agreement (MIT License)
+#
+# Copyright (C) 2019 Chuanyu Pan (pancy17@mails.tsinghua.edu.cn)
+# All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and 
+#associated documentation files (the "Software"), to deal in the Software without restriction, 
+#including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+#and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, 
+#subject to the following conditions:
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in the
+#   documentation and/or other materials provided with the distribution.
+# * Neither the name of the Tsinghua University nor the
+#   names of its contributors may be used to endorse or promote products
+#   derived from this software without specific prior written permission.
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES 
+#OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE 
+#LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR 
+#IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+'''
+Benchmarks of slices rendering
+
+    python benchmarks/bench_slices.py run [--quick] [--repeat N] [-o results.jsonl]
+    python benchmarks/bench_slices.py compare base.jsonl new.jsonl [--threshold 0.1]
+
+run builds synthetic models for every case of the sweep (module count, slice_num, kernels, encoders,
+canvas size) and writes a JSON line per case with the best time of build, layout, raster
+(notes + graph + text) and PNG encode, and the peak RSS. Every case runs in a fresh process, so
+the peak RSS belongs to that case only.
+compare matches the cases of two result files and flags the metrics which are slower (or bigger)
+by more than threshold; it exits with 1 if there is any regression.
+'''
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import itertools
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+METRICS = ('build', 'layout', 'raster', 'encode', 'peak_rss_kb')
+
+SWEEP = {'modules': (10, 100, 500), 'slice_num': (1, 16, 64), 'kernel': (False, True),
+         'encoder': (False, True), 'canvas': ((1000, 1000), (4000, 2000))}
+QUICK = {'modules': (10, 100), 'slice_num': (1, 16), 'kernel': (False, True),
+         'encoder': (False,), 'canvas': ((1000, 1000),)}
+
+
+def case_id(case):
+    return 'modules=%(modules)d,slice_num=%(slice_num)d,kernel=%(kernel)d,encoder=%(encoder)d,canvas=%(canvas)s' % \
+        dict(case, canvas='%dx%d' % tuple(case['canvas']))
+
+
+def build(case):
+    '''a synthetic model: Conv2d/BN/Maxpooling blocks, with an Encoder every 10 modules if asked'''
+    from NetPainter.slices import Model
+    img_w, img_h = case['canvas']
+    model = Model(img_w, img_h)
+    for index in range(case['modules']):
+        if case['encoder'] and index % 10 == 9:
+            model.Encoder(draw_h=120, draw_l=120, draw_w=160)
+        elif index % 3 == 0:
+            model.Conv2d(res_x=64, res_y=64, channel=64, kernel=3 if case['kernel'] else None,
+                         slice_num=case['slice_num'], has_ReLu=True, draw_h=120, draw_l=120, draw_w=4)
+        elif index % 3 == 1:
+            model.BN(draw_h=120, draw_l=120, draw_w=4)
+        else:
+            model.Maxpooling(res_x=32, res_y=32, channel=64, slice_num=case['slice_num'], draw_h=90, draw_l=90, draw_w=4)
+    return model
+
+
+def measure(case, repeat):
+    '''best time of every stage over repeat runs, and the peak RSS of this process'''
+    import resource
+    import NetPainter.layout as layout
+    best = dict((metric, float('inf')) for metric in METRICS[:-1])
+    for _ in range(repeat):
+        begin = time.perf_counter()
+        model = build(case)
+        best['build'] = min(best['build'], time.perf_counter() - begin)
+
+        begin = time.perf_counter()
+        model._update_lenth()
+        if layout.np.available():
+            model.get_layout()
+        best['layout'] = min(best['layout'], time.perf_counter() - begin)
+
+        with model.profile() as profiler:
+            model.render()
+        stages = profiler.records[-1]['stages']
+        raster = sum(stages.get(stage, 0.0) for stage in ('add_notes', 'Draw_Graph', 'Draw_Kernel', 'write_text'))
+        best['raster'] = min(best['raster'], raster)
+        best['encode'] = min(best['encode'], stages.get('write_to_png', 0.0))
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    best['peak_rss_kb'] = peak // 1024 if sys.platform == 'darwin' else peak
+    return best
+
+
+def _run_case(args):
+    case, repeat = args
+    try:
+        return dict(case, case=case_id(case), **measure(case, repeat))
+    except Exception as e:
+        return dict(case, case=case_id(case), error='%s: %s' % (type(e).__name__, e))
+
+
+def run(args):
+    sweep = QUICK if args.quick else SWEEP
+    keys = list(sweep)
+    cases = [dict(zip(keys, values)) for values in itertools.product(*[sweep[key] for key in keys])]
+    environment = {'python': platform.python_version(), 'machine': platform.machine(), 'system': platform.system()}
+    out = open(args.output, 'w') if args.output != '-' else sys.stdout
+    context = multiprocessing.get_context('spawn')
+    try:
+        #one process per case, so that ru_maxrss is the peak of that case
+        with context.Pool(1, maxtasksperchild=1) as pool:
+            for result in pool.imap(_run_case, [(case, args.repeat) for case in cases]):
+                result['canvas'] = list(result['canvas'])
+                result['environment'] = environment
+                out.write(json.dumps(result) + '\n')
+                out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+
+def _load(filename):
+    with open(filename) as fp:
+        return dict((result['case'], result) for result in map(json.loads, fp) if 'error' not in result)
+
+
+def compare(args):
+    base, new = _load(args.base), _load(args.new)
+    regressions = 0
+    print('%-70s %-12s %12s %12s %8s' % ('case', 'metric', 'base', 'new', 'ratio'))
+    for case in sorted(set(base) & set(new)):
+        for metric in METRICS:
+            before, after = base[case][metric], new[case][metric]
+            ratio = after / before if before else float('inf') if after else 1.0
+            flag = ''
+            if ratio > 1 + args.threshold and after - before > args.min_delta.get(metric, 0):
+                flag = '  REGRESSION'
+                regressions += 1
+            print('%-70s %-12s %12.6g %12.6g %8.3f%s' % (case, metric, before, after, ratio, flag))
+    missing = sorted(set(base) ^ set(new))
+    if missing:
+        print('%d case(s) only in one of the files' % len(missing))
+    print('%d regression(s)' % regressions)
+    return 1 if regressions else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='NetPainter slices benchmarks')
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run', help='run the sweep')
+    run_parser.add_argument('-o', '--output', default='-', help='JSON lines result file (default stdout)')
+    run_parser.add_argument('--repeat', type=int, default=3, help='runs per case, the best one is kept')
+    run_parser.add_argument('--quick', action='store_true', help='small sweep')
+    compare_parser = commands.add_parser('compare', help='compare two result files')
+    compare_parser.add_argument('base')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument('--threshold', type=float, default=0.1, help='allowed slowdown ratio (default 0.1)')
+    args = parser.parse_args(argv)
+    if args.command == 'run':
+        return run(args)
+    #ignore differences too small to be measured
+    args.min_delta = {'build': 1e-3, 'layout': 1e-3, 'raster': 1e-3, 'encode': 1e-3, 'peak_rss_kb': 1024}
+    return compare(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
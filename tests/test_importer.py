@@ -0,0 +1,64 @@
+# Software License Agreement (MIT License)
+#
+# Copyright (C) 2019 Chuanyu Pan (pancy17@mails.tsinghua.edu.cn)
+# All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and 
+#associated documentation files (the "Software"), to deal in the Software without restriction, 
+#including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+#and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, 
+#subject to the following conditions:
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in the
+#   documentation and/or other materials provided with the distribution.
+# * Neither the name of the Tsinghua University nor the
+#   names of its contributors may be used to endorse or promote products
+#   derived from this software without specific prior written permission.
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES 
+#OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE 
+#LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR 
+#IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+'''tests of the importer, the ONNX ones need the onnx package'''
+
+import pytest
+import NetPainter.importer as importer
+
+onnx = pytest.importorskip('onnx')
+from onnx import helper, TensorProto
+
+
+def _save(path, nodes, inputs, outputs, initializers=()):
+    graph = helper.make_graph(nodes, 'net', inputs, outputs, list(initializers))
+    onnx.save(helper.make_model(graph), str(path))
+    return str(path)
+
+
+def test_onnx_dynamic_batch(tmp_path):
+    '''a symbolic batch axis (dim_param) is taken as 1, the nodes still get their shapes'''
+    x = helper.make_tensor_value_info('x', TensorProto.FLOAT, ['batch', 3, 32, 32])
+    y = helper.make_tensor_value_info('y', TensorProto.FLOAT, ['batch', 8, 32, 32])
+    w = helper.make_tensor('w', TensorProto.FLOAT, [8, 3, 3, 3], [0.0] * 216)
+    nodes = [helper.make_node('Conv', ['x', 'w'], ['c'], kernel_shape=[3, 3], pads=[1, 1, 1, 1]),
+             helper.make_node('Relu', ['c'], ['y'])]
+    path = _save(tmp_path / 'net.onnx', nodes, [x], [y], [w])
+
+    assert importer.onnx_layers(path) == [('conv', (1, 8, 32, 32), 3), ('relu', (1, 8, 32, 32), None)]
+    model = importer.from_onnx(path, fit=False)
+    assert [module.name for module in model] == ['Conv2d', 'ReLu']
+    assert (model[0].res_x, model[0].res_y, model[0].channel) == (32, 32, 8)
+
+
+def test_onnx_nothing_to_draw(tmp_path):
+    '''a graph without any drawable node is an error, not an empty picture'''
+    x = helper.make_tensor_value_info('x', TensorProto.FLOAT, ['batch', 3])
+    y = helper.make_tensor_value_info('y', TensorProto.FLOAT, ['batch', 3])
+    path = _save(tmp_path / 'net.onnx', [helper.make_node('Identity', ['x'], ['y'])], [x], [y])
+
+    with pytest.raises(ValueError):
+        importer.from_onnx(path)
@@ -0,0 +1,47 @@
+# Software License Agreement (MIT License)
+#
+# Copyright (C) 2019 Chuanyu Pan (pancy17@mails.tsinghua.edu.cn)
+# All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and 
+#associated documentation files (the "Software"), to deal in the Software without restriction, 
+#including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+#and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, 
+#subject to the following conditions:
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in the
+#   documentation and/or other materials provided with the distribution.
+# * Neither the name of the Tsinghua University nor the
+#   names of its contributors may be used to endorse or promote products
+#   derived from this software without specific prior written permission.
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES 
+#OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE 
+#LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR 
+#IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+'''tests of the threaded renderer, they need pycairo'''
+
+import pytest
+
+pytest.importorskip('cairo')
+import NetPainter.text as text
+from NetPainter.slices import Model
+from NetPainter.renderer import Renderer
+
+
+def test_shared_font_cache_stays_bounded():
+    '''renders at many different scales from several threads don't make the shared font cache grow'''
+    models = []
+    for _ in range(4 * text.cache.max_fonts):
+        models.append(Model(300, 200))
+        models[-1].Conv2d(res_x=32, res_y=32, channel=3, kernel=3)
+    with Renderer(workers=4) as renderer:
+        futures = [renderer.submit(model, scale=0.1 + i / 100) for i, model in enumerate(models)]
+        for future in futures:
+            future.result()
+    assert len(text.cache._fonts) <= text.cache.max_fonts
@@ -0,0 +1,76 @@
+# Software License Agreement (MIT License)
+#
+# Copyright (C) 2019 Chuanyu Pan (pancy17@mails.tsinghua.edu.cn)
+# All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and 
+#associated documentation files (the "Software"), to deal in the Software without restriction, 
+#including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+#and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, 
+#subject to the following conditions:
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in the
+#   documentation and/or other materials provided with the distribution.
+# * Neither the name of the Tsinghua University nor the
+#   names of its contributors may be used to endorse or promote products
+#   derived from this software without specific prior written permission.
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES 
+#OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE 
+#LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR 
+#IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+'''tests of the slices Model, the ones with texts need pycairo (for the size of the texts)'''
+
+import json
+import pytest
+from NetPainter.lazy import cairo
+from NetPainter.slices import Model
+
+needs_cairo = pytest.mark.skipif(not cairo.available(), reason='pycairo is not installed')
+
+
+def test_layer_to_dict():
+    '''a Layer is not a dict, to_dict gives one which json can dump'''
+    model = Model()
+    model.Conv2d(res_x=64, res_y=64, channel=3, kernel=(3, 5))
+    data = model[0].to_dict()
+    assert type(data) is dict
+    assert data['kernel'] == [3, 5] and data['res_x'] == 64
+    assert json.loads(json.dumps(data)) == data
+    json.dumps(model.layout_data())
+
+
+@needs_cairo
+def test_fit_canvas_keeps_notations():
+    '''the notation of a thin last module reaches beyond its slices, it must stay in the picture'''
+    model = Model()
+    model.Conv2d(res_x=64, res_y=64, channel=3, kernel=3)
+    model.Softmax(res_x=1, res_y=1, channel=10)
+    model.fit_canvas(margin=20, add_note=False)
+    model._update_lenth()
+    for module in model:
+        x0, y0, x1, y1 = model._text_bbox(module)
+        assert 20 <= x0 and x1 <= model.img_w - 20
+        assert 20 <= y0 and y1 <= model.img_h - 20
+
+
+@needs_cairo
+def test_fit_canvas_keeps_notations_of_wrapped_rows():
+    '''the same at the end of every row when the modules are wrapped'''
+    model = Model()
+    for _ in range(3):
+        model.Conv2d(res_x=64, res_y=64, channel=3)
+        model.Softmax(res_x=100000, res_y=100000, channel=1000)
+    model.set_wrap(rows=3)
+    model.fit_canvas(margin=20, add_note=False)
+    model._update_lenth()
+    assert len(model.rows) == 3
+    for module in model:
+        x0, y0, x1, y1 = model._text_bbox(module)
+        assert 20 <= x0 and x1 <= model.img_w - 20
+        assert 20 <= y0 and y1 <= model.img_h - 20
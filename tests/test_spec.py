@@ -0,0 +1,49 @@
+# Software License Agreement (MIT License)
+#
+# Copyright (C) 2019 Chuanyu Pan (pancy17@mails.tsinghua.edu.cn)
+# All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and 
+#associated documentation files (the "Software"), to deal in the Software without restriction, 
+#including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+#and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, 
+#subject to the following conditions:
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in the
+#   documentation and/or other materials provided with the distribution.
+# * Neither the name of the Tsinghua University nor the
+#   names of its contributors may be used to endorse or promote products
+#   derived from this software without specific prior written permission.
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES 
+#OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE 
+#LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR 
+#IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+'''tests of the model specs'''
+
+import io
+import pytest
+from NetPainter.spec import build_model, iter_specs, InvalidSpec
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 16, 65536])
+def test_iter_specs_multiline_invalid(chunk_size):
+    '''a broken spec over several lines gives exactly one InvalidSpec, the next specs keep their index'''
+    text = '{\n "layers": [ bad ]\n}\n{"layers": []}\n{"layers": [1]\n{\n "layers": [2]\n}\n'
+    specs = list(iter_specs(io.StringIO(text), chunk_size))
+    assert len(specs) == 4
+    assert isinstance(specs[0], InvalidSpec)
+    assert specs[1] == {'layers': []}
+    assert isinstance(specs[2], InvalidSpec)
+    assert specs[3] == {'layers': [2]}
+
+
+def test_build_model_bad_arguments():
+    '''unknown layer arguments are a ValueError like the other mistakes of a spec'''
+    with pytest.raises(ValueError):
+        build_model({'layers': [{'type': 'BN', 'res_x': 8, 'res_y': 8, 'channel': 3, 'foo': 1}]})